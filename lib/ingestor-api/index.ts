@@ -2,10 +2,13 @@ import {
   aws_apigateway as apigateway,
   aws_dynamodb as dynamodb,
   aws_ec2 as ec2,
+  aws_events as eventbridge,
+  aws_events_targets as targets,
   aws_iam as iam,
   aws_lambda as lambda,
   aws_logs,
   aws_lambda_event_sources as events,
+  aws_s3 as s3,
   aws_secretsmanager as secretsmanager,
   aws_ssm as ssm,
   Duration,
@@ -15,17 +18,32 @@ import {
 import { Construct } from "constructs";
 import { CustomLambdaFunctionProps } from "../utils";
 
+const STATUS_SUMMARY_INDEX = "status-summary";
+
 export class StacIngestor extends Construct {
   table: dynamodb.Table;
+  stagingBucket: s3.Bucket;
+  refreshTable: dynamodb.Table;
   public handlerRole: iam.Role;
 
   constructor(scope: Construct, id: string, props: StacIngestorProps) {
     super(scope, id);
 
-    this.table = this.buildTable();
+    this.table = this.buildTable({
+      statusSummaryIndex: props.statusSummaryIndex,
+    });
+    this.stagingBucket = this.buildStagingBucket({
+      expiration: props.itemStagingExpiration,
+    });
+    this.refreshTable = this.buildRefreshTable();
 
     const env: Record<string, string> = {
       DYNAMODB_TABLE: this.table.tableName,
+      ITEM_STAGING_BUCKET: this.stagingBucket.bucketName,
+      COLLECTION_REFRESH_TABLE: this.refreshTable.tableName,
+      ...(props.statusSummaryIndex
+        ? { STATUS_SUMMARY_INDEX: STATUS_SUMMARY_INDEX }
+        : {}),
       ROOT_PATH: `/${props.stage}`,
       NO_PYDANTIC_SSM_SETTINGS: "1",
       STAC_URL: props.stacUrl,
@@ -49,6 +67,8 @@ export class StacIngestor extends Construct {
 
     const handler = this.buildApiLambda({
       table: this.table,
+      stagingBucket: this.stagingBucket,
+      exportBucket: props.exportBucket,
       env,
       dataAccessRole: props.dataAccessRole,
       stage: props.stage,
@@ -69,14 +89,29 @@ export class StacIngestor extends Construct {
 
     this.buildIngestor({
       table: this.table,
+      stagingBucket: this.stagingBucket,
+      refreshTable: this.refreshTable,
       env: env,
       dbSecret: props.stacDbSecret,
       dbVpc: props.vpc,
       dbSecurityGroup: props.stacDbSecurityGroup,
       subnetSelection: props.subnetSelection,
+      parallelizationFactor: props.ingestorParallelizationFactor,
+      reservedConcurrency: props.ingestorReservedConcurrency,
       lambdaFunctionOptions: props.ingestorLambdaFunctionOptions
     });
 
+    this.buildRefresher({
+      refreshTable: this.refreshTable,
+      env: env,
+      dbSecret: props.stacDbSecret,
+      dbVpc: props.vpc,
+      dbSecurityGroup: props.stacDbSecurityGroup,
+      subnetSelection: props.subnetSelection,
+      interval: props.collectionRefreshInterval,
+      lambdaFunctionOptions: props.refresherLambdaFunctionOptions,
+    });
+
     this.registerSsmParameter({
       name: "dynamodb_table",
       value: this.table.tableName,
@@ -84,7 +119,7 @@ export class StacIngestor extends Construct {
     });
   }
 
-  private buildTable(): dynamodb.Table {
+  private buildTable(props: { statusSummaryIndex?: boolean }): dynamodb.Table {
     const table = new dynamodb.Table(this, "ingestions-table", {
       partitionKey: { name: "created_by", type: dynamodb.AttributeType.STRING },
       sortKey: { name: "id", type: dynamodb.AttributeType.STRING },
@@ -99,11 +134,49 @@ export class StacIngestor extends Construct {
       sortKey: { name: "created_at", type: dynamodb.AttributeType.STRING },
     });
 
+    if (props.statusSummaryIndex) {
+      // Slim copy of the status index, for listing and counting ingestions
+      // without reading their items
+      table.addGlobalSecondaryIndex({
+        indexName: STATUS_SUMMARY_INDEX,
+        partitionKey: { name: "status", type: dynamodb.AttributeType.STRING },
+        sortKey: { name: "created_at", type: dynamodb.AttributeType.STRING },
+        projectionType: dynamodb.ProjectionType.INCLUDE,
+        nonKeyAttributes: ["message", "updated_at"],
+      });
+    }
+
     return table;
   }
 
+  private buildStagingBucket(props: { expiration?: Duration }): s3.Bucket {
+    // Holds STAC items too large to store in the ingestions table
+    return new s3.Bucket(this, "item-staging-bucket", {
+      blockPublicAccess: s3.BlockPublicAccess.BLOCK_ALL,
+      encryption: s3.BucketEncryption.S3_MANAGED,
+      enforceSSL: true,
+      removalPolicy: RemovalPolicy.DESTROY,
+      autoDeleteObjects: true,
+      lifecycleRules: [
+        { expiration: props.expiration ?? Duration.days(30) },
+      ],
+    });
+  }
+
+  private buildRefreshTable(): dynamodb.Table {
+    // Tracks collections loaded into since their extents and summaries were
+    // last refreshed
+    return new dynamodb.Table(this, "collection-refreshes-table", {
+      partitionKey: { name: "collection", type: dynamodb.AttributeType.STRING },
+      billingMode: dynamodb.BillingMode.PAY_PER_REQUEST,
+      removalPolicy: RemovalPolicy.DESTROY,
+    });
+  }
+
   private buildApiLambda(props: {
     table: dynamodb.ITable;
+    stagingBucket: s3.IBucket;
+    exportBucket?: s3.IBucket;
     env: Record<string, string>;
     dataAccessRole: iam.IRole;
     stage: string;
@@ -149,16 +222,26 @@ export class StacIngestor extends Construct {
 
     props.table.grantReadWriteData(handler);
 
+    // Allow handler to stage large items
+    props.stagingBucket.grantReadWrite(handler);
+
+    // Allow handler to export ingestions
+    props.exportBucket?.grantWrite(handler);
+
     return handler;
   }
 
   private buildIngestor(props: {
     table: dynamodb.ITable;
+    stagingBucket: s3.IBucket;
+    refreshTable: dynamodb.ITable;
     env: Record<string, string>;
     dbSecret: secretsmanager.ISecret;
     dbVpc: undefined | ec2.IVpc;
     dbSecurityGroup: ec2.ISecurityGroup;
     subnetSelection: undefined | ec2.SubnetSelection;
+    parallelizationFactor?: number;
+    reservedConcurrency?: number;
     lambdaFunctionOptions?: CustomLambdaFunctionProps;
   }): lambda.Function {
 
@@ -179,6 +262,9 @@ export class StacIngestor extends Construct {
       allowPublicSubnet: true,
       environment: { DB_SECRET_ARN: props.dbSecret.secretArn, ...props.env },
       role: this.handlerRole,
+      // Bounds the connections held to the DB, and the ingestors contending for
+      // partition locks
+      reservedConcurrentExecutions: props.reservedConcurrency,
       // overwrites defaults with user-provided configurable properties
       ...props.lambdaFunctionOptions,
     });
@@ -195,8 +281,14 @@ export class StacIngestor extends Construct {
       );
     }
 
-    // Allow handler to write results back to DBƒ
-    props.table.grantWriteData(handler);
+    // Allow handler to read manifest checkpoints and write results back to DB
+    props.table.grantReadWriteData(handler);
+
+    // Allow handler to fetch staged items
+    props.stagingBucket.grantRead(handler);
+
+    // Allow handler to record collections loaded into
+    props.refreshTable.grantReadWriteData(handler);
 
     // Trigger handler from writes to DynamoDB table
     handler.addEventSource(
@@ -208,12 +300,83 @@ export class StacIngestor extends Construct {
         // Read oldest data first.
         startingPosition: lambda.StartingPosition.TRIM_HORIZON,
         retryAttempts: 1,
+        // Concurrent batches per stream shard. Ingestors loading into the same
+        // partition take turns, requeuing items rather than waiting too long.
+        parallelizationFactor: props.parallelizationFactor ?? 1,
+        // Only retry the records reported as failed by the handler.
+        reportBatchItemFailures: true,
+        // Only invoke for queued ingestions, skipping the status updates
+        // written back by the handler itself.
+        filters: [
+          lambda.FilterCriteria.filter({
+            eventName: lambda.FilterRule.or("INSERT", "MODIFY"),
+            dynamodb: {
+              NewImage: {
+                status: { S: lambda.FilterRule.isEqual("queued") },
+              },
+            },
+          }),
+        ],
       })
     );
 
     return handler;
   }
 
+  private buildRefresher(props: {
+    refreshTable: dynamodb.ITable;
+    env: Record<string, string>;
+    dbSecret: secretsmanager.ISecret;
+    dbVpc: undefined | ec2.IVpc;
+    dbSecurityGroup: ec2.ISecurityGroup;
+    subnetSelection: undefined | ec2.SubnetSelection;
+    interval?: Duration;
+    lambdaFunctionOptions?: CustomLambdaFunctionProps;
+  }): lambda.Function {
+
+    const handler = new lambda.Function(this, "collection-refresher", {
+      // defaults
+      runtime: lambda.Runtime.PYTHON_3_11,
+      handler: "src.refresher.handler",
+      memorySize: 1024,
+      logRetention: aws_logs.RetentionDays.ONE_WEEK,
+      timeout: Duration.minutes(5),
+      code: lambda.Code.fromDockerBuild(__dirname, {
+        file: "runtime/Dockerfile",
+        buildArgs: { PYTHON_VERSION: '3.11' },
+      }),
+      vpc: props.dbVpc,
+      vpcSubnets: props.subnetSelection,
+      allowPublicSubnet: true,
+      environment: { DB_SECRET_ARN: props.dbSecret.secretArn, ...props.env },
+      // overwrites defaults with user-provided configurable properties
+      ...props.lambdaFunctionOptions,
+    });
+
+    // Allow handler to read DB secret
+    props.dbSecret.grantRead(handler);
+
+    // Allow handler to connect to DB
+    if (props.dbVpc){
+      props.dbSecurityGroup.addIngressRule(
+        handler.connections.securityGroups[0],
+        ec2.Port.tcp(5432),
+        "Allow connections from STAC Ingestor collection refresher"
+      );
+    }
+
+    // Allow handler to read and mark collections to refresh
+    props.refreshTable.grantReadWriteData(handler);
+
+    // Refresh collections loaded into at most once per interval
+    new eventbridge.Rule(this, "collection-refresher-schedule", {
+      schedule: eventbridge.Schedule.rate(props.interval ?? Duration.minutes(5)),
+      targets: [new targets.LambdaFunction(handler)],
+    });
+
+    return handler;
+  }
+
   private buildApiEndpoint(props: {
     handler: lambda.IFunction;
     stage: string;
@@ -298,6 +461,55 @@ export interface StacIngestorProps {
    */
   readonly subnetSelection?: ec2.SubnetSelection;
 
+  /**
+   * Whether to add a status index projecting only ingestion summaries, which
+   * makes listing ingestions in the summary or count views cheaper at the cost
+   * of replicating writes to the index.
+   *
+   * @default false
+   */
+  readonly statusSummaryIndex?: boolean;
+
+  /**
+   * Bucket to which administrators may export ingestion records.
+   */
+  readonly exportBucket?: s3.IBucket;
+
+  /**
+   * How long STAC items too large to store in DynamoDB are kept in the staging
+   * bucket, after which their ingestions no longer include them.
+   *
+   * @default - 30 days
+   */
+  readonly itemStagingExpiration?: Duration;
+
+  /**
+   * Number of batches from each shard of the ingestions table's stream that
+   * are loaded concurrently, between 1 and 10. Concurrent ingestors take turns
+   * loading into the same pgSTAC partition, so higher factors mostly benefit
+   * batches spread across many partitions.
+   *
+   * @default 1
+   */
+  readonly ingestorParallelizationFactor?: number;
+
+  /**
+   * Reserved concurrency of the ingestor, bounding the number of connections it
+   * holds to pgSTAC. Should be at least the number of stream shards multiplied
+   * by the parallelization factor, or batches queue behind throttled ingestors.
+   *
+   * @default - no reserved concurrency
+   */
+  readonly ingestorReservedConcurrency?: number;
+
+  /**
+   * How often the extents and summaries of collections that items have been
+   * loaded into are refreshed.
+   *
+   * @default - 5 minutes
+   */
+  readonly collectionRefreshInterval?: Duration;
+
   /**
    * Environment variables to be sent to Lambda.
    */
@@ -332,4 +544,11 @@ export interface StacIngestorProps {
      */
 readonly ingestorLambdaFunctionOptions?: CustomLambdaFunctionProps;
 
+  /**
+   * Can be used to override the default lambda function properties.
+   *
+   * @default - default settings are defined in the construct.
+   */
+  readonly refresherLambdaFunctionOptions?: CustomLambdaFunctionProps;
+
 }
@@ -0,0 +1,90 @@
+"""
+Benchmark the strategies with which the ingestor loads items into pgSTAC.
+
+Generates synthetic items in an existing collection, loads them with each
+strategy and reports the items loaded per second, deleting the items afterwards.
+Run from the runtime directory against a disposable database, e.g.
+
+    python -m scripts.benchmark_load --dsn postgresql://... --collection test
+"""
+
+import argparse
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List
+
+from pypgstac.db import PgstacDB
+from pypgstac.load import Methods
+from src.loader import Loader, LoadStrategy
+
+
+def make_items(collection_id: str, count: int, days: int) -> List[Dict[str, Any]]:
+    start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+    run = uuid.uuid4().hex[:8]
+    return [
+        {
+            "type": "Feature",
+            "stac_version": "1.0.0",
+            "stac_extensions": [],
+            "id": f"benchmark-{run}-{i}",
+            "collection": collection_id,
+            "geometry": {
+                "type": "Polygon",
+                "coordinates": [
+                    [
+                        [i % 360 - 180, 0],
+                        [i % 360 - 179, 0],
+                        [i % 360 - 179, 1],
+                        [i % 360 - 180, 1],
+                        [i % 360 - 180, 0],
+                    ]
+                ],
+            },
+            "bbox": [i % 360 - 180, 0, i % 360 - 179, 1],
+            "properties": {
+                "datetime": (start + timedelta(days=i % days)).isoformat(),
+                "eo:cloud_cover": i % 100,
+            },
+            "links": [],
+            "assets": {
+                "data": {"href": f"s3://benchmark/{run}/{i}.tif", "roles": ["data"]}
+            },
+        }
+        for i in range(count)
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dsn", required=True)
+    parser.add_argument("--collection", required=True)
+    parser.add_argument("--items", type=int, default=10000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--method", type=Methods, default=Methods.upsert)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    loader = Loader(db=PgstacDB(dsn=args.dsn))
+    for strategy in LoadStrategy:
+        rates = []
+        for _ in range(args.repeat):
+            items = make_items(args.collection, args.items, args.days)
+            start = time.perf_counter()
+            loader.load_items(file=items, insert_mode=args.method, strategy=strategy)
+            rates.append(args.items / (time.perf_counter() - start))
+
+            with loader.conn.cursor() as cur:
+                cur.execute(
+                    "DELETE FROM pgstac.items WHERE collection = %s AND id LIKE %s;",
+                    [args.collection, items[0]["id"].rsplit("-", 1)[0] + "-%"],
+                )
+        print(
+            f"{strategy.value}: {max(rates):.0f} items/s best, "
+            f"{sum(rates) / len(rates):.0f} items/s mean of {args.repeat} loads of "
+            f"{args.items} items ({args.method.value})"
+        )
+
+
+if __name__ == "__main__":
+    main()
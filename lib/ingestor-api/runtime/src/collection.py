@@ -8,7 +8,7 @@ from .schemas import StacCollection
 from .utils import get_db_credentials
 
 
-def ingest(collection: StacCollection):
+def ingest(collection: StacCollection, method: Methods = Methods.upsert):
     """
     Takes a collection model,
     does necessary preprocessing,
@@ -21,7 +21,7 @@ def ingest(collection: StacCollection):
             collection = [
                 collection.to_dict()
             ]  # pypgstac wants either a string or an Iterable of dicts.
-            loader.load_collections(file=collection, insert_mode=Methods.upsert)
+            loader.load_collections(file=collection, insert_mode=method)
     except Exception as e:
         print(f"Encountered failure loading collection into pgSTAC: {e}")
 
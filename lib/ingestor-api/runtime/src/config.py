@@ -1,9 +1,10 @@
 import os
 from getpass import getuser
-from typing import Optional
+from typing import List, Literal, Optional
 
 from pydantic import AnyHttpUrl, BaseSettings, Field, constr
 from pydantic_ssm_settings import AwsSsmSourceConfig
+from pypgstac.load import Methods
 
 AwsArn = constr(regex=r"^arn:aws:iam::\d{12}:role/.+")
 
@@ -27,6 +28,203 @@ class Settings(BaseSettings):
         description="Path from where to serve this URL.", default=False
     )
 
+    asset_validation_concurrency: int = Field(
+        description="Maximum number of assets to check for accessibility at once",
+        default=10,
+    )
+
+    asset_validation_connect_timeout: float = Field(
+        description="Seconds to wait to connect to an asset's host when checking it",
+        default=5,
+    )
+
+    asset_validation_read_timeout: float = Field(
+        description="Seconds to wait for a response when checking an asset",
+        default=10,
+    )
+
+    bulk_ingestion_max_items: int = Field(
+        description="Maximum number of items accepted by a bulk ingestion request",
+        default=500,
+    )
+
+    item_validation_concurrency: int = Field(
+        description="Maximum number of items of a bulk ingestion to validate at once",
+        default=4,
+    )
+
+    manifest_chunk_size: int = Field(
+        description="Number of items of a manifest to load into pgSTAC at once",
+        default=500,
+    )
+
+    manifest_range_size: int = Field(
+        description="Number of bytes of a manifest to read from S3 at once",
+        default=8 * 1024**2,
+    )
+
+    manifest_max_compressed_size: int = Field(
+        description=(
+            "Largest gzipped manifest accepted, in bytes, as resuming its load "
+            "decompresses it again from its beginning"
+        ),
+        default=512 * 1024**2,
+    )
+
+    manifest_time_margin: int = Field(
+        description=(
+            "Seconds before the ingestor Lambda's timeout at which to stop loading "
+            "a manifest and queue the remainder"
+        ),
+        default=30,
+    )
+
+    status_update_concurrency: int = Field(
+        description="Maximum number of ingestion statuses to update at once",
+        default=16,
+    )
+
+    collection_lookup: Literal["pgstac", "stac_api"] = Field(
+        description=(
+            "Where to check that collections exist. Lookups against pgSTAC fall "
+            "back to the STAC API on failure."
+        ),
+        default="pgstac",
+    )
+
+    db_pool_max_size: int = Field(
+        description="Maximum number of pooled connections to pgSTAC", default=4
+    )
+
+    db_pool_timeout: float = Field(
+        description="Seconds to wait for a connection to pgSTAC", default=5
+    )
+
+    collection_cache_maxsize: int = Field(
+        description="Maximum number of collection lookups to cache", default=1024
+    )
+
+    collection_cache_ttl: int = Field(
+        description="Seconds to remember that a collection exists", default=300
+    )
+
+    collection_cache_negative_ttl: int = Field(
+        description="Seconds to remember that a collection does not exist", default=30
+    )
+
+    status_summary_index: Optional[str] = Field(
+        description=(
+            "Name of a status index projecting only ingestion summaries, used to "
+            "list or count ingestions without reading their STAC items"
+        ),
+    )
+
+    load_methods: List[Methods] = Field(
+        description=(
+            "Methods with which requests may choose to load items and collections "
+            "into pgSTAC"
+        ),
+        default=[Methods.upsert, Methods.insert, Methods.ignore, Methods.insert_ignore],
+    )
+
+    load_concurrency: int = Field(
+        description=(
+            "Maximum number of connections over which to load groups of items "
+            "sharing a pgSTAC partition at once"
+        ),
+        default=1,
+    )
+
+    partition_lock_timeout: Optional[float] = Field(
+        description=(
+            "Seconds to wait for another ingestor to finish loading into a pgSTAC "
+            "partition before requeuing the items to load into it, loading without "
+            "taking partition locks if unset"
+        ),
+        default=10,
+    )
+
+    staging_load_threshold: Optional[int] = Field(
+        description=(
+            "Number of items sharing a pgSTAC partition from which they are loaded "
+            "by copying them into pgSTAC's staging tables and merging them in SQL, "
+            "rather than preparing each item in Python, loading every batch the "
+            "latter way if unset"
+        ),
+    )
+
+    partition_lock_time_margin: int = Field(
+        description=(
+            "Seconds before the ingestor Lambda's timeout after which it stops "
+            "waiting for partition locks, queuing again the items whose partition "
+            "is locked"
+        ),
+        default=30,
+    )
+
+    collection_refresh_table: Optional[str] = Field(
+        description=(
+            "DynamoDB table tracking collections whose extents and summaries are to "
+            "be refreshed, disabling refreshes if unset"
+        ),
+    )
+
+    metrics_namespace: str = Field(
+        description="CloudWatch namespace of metrics", default="StacIngestor"
+    )
+
+    item_compression: Optional[Literal["gzip", "zstd"]] = Field(
+        description="Compression with which to store STAC items in DynamoDB",
+    )
+
+    item_staging_bucket: Optional[str] = Field(
+        description="S3 bucket in which to stage STAC items too large for DynamoDB",
+    )
+
+    item_staging_threshold: int = Field(
+        description=(
+            "Size in bytes above which STAC items are staged in S3 rather than "
+            "stored in DynamoDB"
+        ),
+        default=100 * 1024,
+    )
+
+    item_staging_concurrency: int = Field(
+        description="Maximum number of STAC items to stage in S3 at once",
+        default=16,
+    )
+
+    item_fetch_concurrency: int = Field(
+        description="Maximum number of staged STAC items to fetch from S3 at once",
+        default=16,
+    )
+
+    admin_usernames: List[str] = Field(
+        description="Users permitted to perform administrative operations",
+        default=[],
+    )
+
+    export_concurrency: int = Field(
+        description="Maximum number of table segments to export at once", default=8
+    )
+
+    export_time_limit: float = Field(
+        description=(
+            "Seconds after which an export stops, returning progress from which to "
+            "resume it"
+        ),
+        default=20,
+    )
+
+    export_response_max_bytes: int = Field(
+        description=(
+            "Bytes of records after which an export to the response stops, returning "
+            "progress from which to resume it, keeping responses within Lambda's "
+            "6 MB payload limit"
+        ),
+        default=5 * 1024**2,
+    )
+
     class Config(AwsSsmSourceConfig):
         env_file = ".env"
 
@@ -1,3 +1,4 @@
+import functools
 import logging
 from typing import Optional
 
@@ -6,6 +7,9 @@ import requests
 from authlib.jose import JsonWebKey, JsonWebToken, JWTClaims, KeySet, errors
 from cachetools import TTLCache, cached
 from fastapi import Depends, HTTPException, Request, security
+from fastapi.exceptions import RequestValidationError
+from pydantic import error_wrappers
+from pypgstac.load import Methods
 
 from . import config, services
 
@@ -72,13 +76,83 @@ get_username = (
 )
 
 
+def get_admin_username(
+    username: str = Depends(get_username),
+    settings: config.Settings = Depends(get_settings),
+) -> str:
+    if username not in settings.admin_usernames:
+        raise HTTPException(
+            status_code=403, detail="Operation restricted to administrators"
+        )
+    return username
+
+
+def get_load_method(
+    method: Methods = Methods.upsert,
+    settings: config.Settings = Depends(get_settings),
+) -> Methods:
+    if method not in settings.load_methods:
+        raise RequestValidationError(
+            [
+                error_wrappers.ErrorWrapper(
+                    ValueError(f"Load method {method.value} is not permitted"),
+                    ("query", "method"),
+                )
+            ]
+        )
+    return method
+
+
+def get_collection_load_method(method: Methods = Depends(get_load_method)) -> Methods:
+    # pgSTAC can't delete and reinsert collections
+    if method == Methods.delsert:
+        raise RequestValidationError(
+            [
+                error_wrappers.ErrorWrapper(
+                    ValueError("Collections can't be loaded with delsert"),
+                    ("query", "method"),
+                )
+            ]
+        )
+    return method
+
+
 def get_table(settings: config.Settings = Depends(get_settings)):
     client = boto3.resource("dynamodb")
     return client.Table(settings.dynamodb_table)
 
 
-def get_db(table=Depends(get_table)) -> services.Database:
-    return services.Database(table=table)
+def get_collection_refresh_table(settings: config.Settings = Depends(get_settings)):
+    client = boto3.resource("dynamodb")
+    return client.Table(settings.collection_refresh_table)
+
+
+@functools.cache
+def get_staging_client():
+    return boto3.client("s3")
+
+
+def get_item_store(
+    settings: config.Settings = Depends(get_settings),
+) -> services.ItemStore:
+    return services.ItemStore(
+        client=get_staging_client(),
+        bucket=settings.item_staging_bucket,
+        threshold=settings.item_staging_threshold,
+    )
+
+
+def get_db(
+    table=Depends(get_table),
+    item_store=Depends(get_item_store),
+    settings: config.Settings = Depends(get_settings),
+) -> services.Database:
+    return services.Database(
+        table=table,
+        item_store=item_store,
+        item_compression=settings.item_compression,
+        summary_index=settings.status_summary_index,
+    )
 
 
 def fetch_ingestion(
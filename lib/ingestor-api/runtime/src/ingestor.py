@@ -1,13 +1,14 @@
 import os
-from datetime import datetime
-from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence
-
-from boto3.dynamodb.types import TypeDeserializer
+import time
+from typing import TYPE_CHECKING, Iterator, List, Optional, Sequence, Union
 
+from . import services
 from .config import settings
-from .dependencies import get_table
-from .schemas import Ingestion, Status
-from .utils import get_db_credentials, load_items
+from .dependencies import get_collection_refresh_table, get_item_store, get_table
+from .loader import Loader, PartitionLocked
+from .schemas import Ingestion, Manifest, QueuedIngestion, Status
+from .utils import get_db_credentials, iter_manifest_lines, load_items, load_manifest
+from .validators import get_s3_client
 
 if TYPE_CHECKING:
     from aws_lambda_typing import context as context_
@@ -15,68 +16,226 @@ if TYPE_CHECKING:
     from aws_lambda_typing.events.dynamodb_stream import DynamodbRecord
 
 
-def get_queued_ingestions(records: List["DynamodbRecord"]) -> Iterator[Ingestion]:
-    deserializer = TypeDeserializer()
+def get_queued_ingestions(
+    records: List["DynamodbRecord"],
+) -> Iterator[QueuedIngestion]:
+    # The event source only delivers queued ingestions, but filter defensively
     for record in records:
-        # Parse Record
-        parsed = {
-            k: deserializer.deserialize(v)
-            for k, v in record["dynamodb"]["NewImage"].items()
-        }
-        ingestion = Ingestion.parse_obj(parsed)
-        if ingestion.status == Status.queued:
+        if ingestion := QueuedIngestion.from_stream_record(record):
             yield ingestion
 
 
 def update_dynamodb(
-    ingestions: Sequence[Ingestion],
+    db: services.Database,
+    ingestions: Sequence[Union[Ingestion, QueuedIngestion]],
     status: Status,
     message: Optional[str] = None,
+    from_statuses: Sequence[Status] = (Status.queued, Status.failed),
+    messages: Optional[Sequence[str]] = None,
 ):
     """
-    Bulk update DynamoDB with ingestion results.
+    Update the status of ingestions in DynamoDB, leaving those whose status has
+    since changed (e.g. cancelled ingestions) untouched. Failed ingestions may be
+    updated, as the batch they belong to may have been retried.
     """
     # Update records in DynamoDB
     print(f"Updating ingested items status in DynamoDB, marking as {status}...")
-    table = get_table(settings)
-    with table.batch_writer(overwrite_by_pkeys=["created_by", "id"]) as batch:
-        for ingestion in ingestions:
-            batch.put_item(
-                Item=ingestion.copy(
-                    update={
-                        "status": status,
-                        "message": message,
-                        "updated_at": datetime.now(),
-                    }
-                ).dynamodb_dict()
-            )
+    skipped = db.transition_many(
+        ingestions,
+        status,
+        message=message,
+        from_statuses=from_statuses,
+        max_workers=settings.status_update_concurrency,
+        messages=messages,
+    )
+    for ingestion in skipped:
+        print(f"Status of ingestion {ingestion.id} changed, not marking as {status}")
 
 
-def handler(event: "events.DynamoDBStreamEvent", context: "context_.Context"):
-    # Parse input
-    ingestions = list(get_queued_ingestions(event["Records"]))
-    if not ingestions:
-        print("No queued ingestions to process")
+def update_manifest(
+    ingestion: Ingestion, status: Status, message: Optional[str] = None
+) -> bool:
+    """
+    Update the status and progress of a manifest ingestion in DynamoDB.
+    """
+    return services.Database(table=get_table(settings)).transition(
+        ingestion,
+        status,
+        message=message,
+        from_statuses=(Status.queued, Status.started),
+        manifest=ingestion.manifest,
+    )
+
+
+def get_remaining_seconds(context: "context_.Context") -> float:
+    if hasattr(context, "get_remaining_time_in_millis"):
+        return context.get_remaining_time_in_millis() / 1000
+    return float("inf")
+
+
+def fetch_staged_items(ingestions: Sequence[QueuedIngestion]):
+    """
+    Fetch the STAC items of ingestions that were staged in S3 as they were too
+    large to store in DynamoDB.
+    """
+    staged = [i for i in ingestions if i.item is None and i.item_url]
+    if not staged:
         return
+    print(f"Fetching {len(staged)} staged items from S3...")
+    items = get_item_store(settings).get_many(
+        [i.item_url for i in staged], max_workers=settings.item_fetch_concurrency
+    )
+    for ingestion, item in zip(staged, items):
+        ingestion.item = item
+
+
+def ingest_items(
+    ingestions: Sequence[QueuedIngestion], context: "context_.Context"
+) -> List[QueuedIngestion]:
+    """
+    Load a batch of item ingestions into pgSTAC, recording the outcome of each.
+    Items that fail to load are marked as failed, while items whose partition is
+    being loaded by another ingestor are queued again. Returns the ingestions that
+    should be retried, which is the whole batch if loading failed for reasons
+    unrelated to its items.
+    """
+    db = services.Database(table=get_table(settings))
 
     # Insert into PgSTAC DB
-    outcome = Status.succeeded
-    message = None
     try:
-        load_items(
+        fetch_staged_items(ingestions)
+        failures = load_items(
             creds=get_db_credentials(os.environ["DB_SECRET_ARN"]),
             ingestions=ingestions,
+            max_workers=settings.load_concurrency,
+            lock_timeout=settings.partition_lock_timeout,
+            staging_threshold=settings.staging_load_threshold,
+            deadline=time.monotonic()
+            + get_remaining_seconds(context)
+            - settings.partition_lock_time_margin,
         )
     except Exception as e:
         print(f"Encountered failure loading items into pgSTAC: {e}")
-        outcome = Status.failed
-        message = str(e)
+        update_dynamodb(db, ingestions, status=Status.failed, message=str(e))
+        return list(ingestions)
 
     # Update DynamoDB with outcome
+    failed_ids = {id(ingestion) for ingestion, _ in failures}
     update_dynamodb(
-        ingestions=ingestions,
-        status=outcome,
-        message=message,
+        db,
+        [i for i in ingestions if id(i) not in failed_ids],
+        status=Status.succeeded,
+    )
+
+    # Queue deferred items again, so that the resulting stream records trigger
+    # another attempt once the partition is free
+    if deferred := [i for i, e in failures if isinstance(e, PartitionLocked)]:
+        update_dynamodb(
+            db,
+            deferred,
+            status=Status.queued,
+            message="Waiting for another ingestor to load into the same partition",
+        )
+    failures = [(i, e) for i, e in failures if not isinstance(e, PartitionLocked)]
+    for ingestion, error in failures:
+        print(f"Encountered failure loading item {ingestion.id} into pgSTAC: {error}")
+    if failures:
+        update_dynamodb(
+            db,
+            [ingestion for ingestion, _ in failures],
+            status=Status.failed,
+            messages=[str(error) for _, error in failures],
+        )
+    return []
+
+
+def ingest_manifest(ingestion: QueuedIngestion, context: "context_.Context"):
+    """
+    Load a manifest ingestion into pgSTAC, resuming from its last checkpoint. If
+    the Lambda nears its timeout, the ingestion is queued again to be resumed by
+    the invocation that the resulting stream record triggers.
+    """
+    # A previous attempt may have made progress since this stream record was written
+    response = get_table(settings).get_item(
+        Key={"created_by": ingestion.created_by, "id": ingestion.id}
+    )
+    ingestion = (
+        Ingestion.parse_obj(response["Item"])
+        if "Item" in response
+        else ingestion.to_ingestion()
     )
+    if ingestion.status not in (Status.queued, Status.started):
+        print(
+            f"Skipping manifest ingestion {ingestion.id} with status {ingestion.status}"
+        )
+        return
+
+    def checkpoint(manifest: Manifest) -> bool:
+        print(f"Loaded {manifest.items_loaded} items from {manifest.url}")
+        if not update_manifest(ingestion, Status.started):
+            print(f"Status of manifest ingestion {ingestion.id} changed, stopping")
+            return False
+        return get_remaining_seconds(context) > settings.manifest_time_margin
+
+    try:
+        lines = iter_manifest_lines(
+            get_s3_client(),
+            ingestion.manifest,
+            range_size=settings.manifest_range_size,
+            deadline=time.monotonic()
+            + get_remaining_seconds(context)
+            - settings.manifest_time_margin,
+            **{"RequestPayer": "requester"} if settings.requester_pays else {},
+        )
+        completed = load_manifest(
+            creds=get_db_credentials(os.environ["DB_SECRET_ARN"]),
+            manifest=ingestion.manifest,
+            lines=lines,
+            chunk_size=settings.manifest_chunk_size,
+            checkpoint=checkpoint,
+            method=ingestion.method,
+        )
+    except Exception as e:
+        print(f"Encountered failure loading manifest into pgSTAC: {e}")
+        update_manifest(ingestion, Status.failed, message=str(e))
+        return
 
+    update_manifest(ingestion, Status.succeeded if completed else Status.queued)
+
+
+def record_touched_collections():
+    """
+    Record the collections that items were loaded into, for their extents and
+    summaries to be refreshed.
+    """
+    collection_ids = Loader.take_touched_collections()
+    if not collection_ids or not settings.collection_refresh_table:
+        return
+    try:
+        services.CollectionRefreshes(get_collection_refresh_table(settings)).touch(
+            collection_ids
+        )
+    except Exception as e:
+        print(f"Unable to record collections to refresh {collection_ids}: {e}")
+
+
+def handler(event: "events.DynamoDBStreamEvent", context: "context_.Context"):
+    # Parse input
+    ingestions = list(get_queued_ingestions(event["Records"]))
+    if not ingestions:
+        print("No queued ingestions to process")
+        return {"batchItemFailures": []}
+
+    retries = []
+    if items := [ingestion for ingestion in ingestions if not ingestion.manifest]:
+        retries = ingest_items(items, context)
+
+    for ingestion in ingestions:
+        if ingestion.manifest:
+            ingest_manifest(ingestion, context)
+
+    record_touched_collections()
     print("Completed batch...")
+
+    # Report records to be retried
+    return {"batchItemFailures": [{"itemIdentifier": i.sequence_number} for i in retries]}
@@ -1,22 +1,260 @@
 """Utilities to bulk load data into pgstac from json/ndjson."""
 
 import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from enum import Enum
+from pathlib import Path
+from typing import (
+    Any,
+    ContextManager,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Union,
+)
 
+import orjson
+from psycopg.types.json import Jsonb
 from pypgstac.load import Loader as BaseLoader
+from pypgstac.load import Methods, Partition
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of distinct values to list in a collection summary
+MAX_SUMMARY_VALUES = 100
+
+# Namespace of the advisory locks taken on partitions, keeping them apart from
+# any other advisory locks taken in the database
+LOCK_NAMESPACE = "stac-ingestor"
+
+
+# pgSTAC's staging tables, whose triggers merge the items copied into them
+STAGING_TABLES = {
+    Methods.insert: "items_staging",
+    Methods.ignore: "items_staging_ignore",
+    Methods.insert_ignore: "items_staging_ignore",
+    Methods.upsert: "items_staging_upsert",
+}
+
+
+class PartitionLocked(Exception):
+    """Another loader held a partition's lock for longer than we could wait"""
+
+
+class LoadStrategy(str, Enum):
+    """How items are loaded into pgSTAC"""
+
+    # pypgstac prepares each item in Python, copying them into their partitions
+    partitions = "partitions"
+    # items are copied as they are into a staging table, and pgSTAC prepares
+    # and merges them into their partitions in SQL
+    staging = "staging"
+
 
 class Loader(BaseLoader):
     """Utilities for loading data and updating collection summaries/extents."""
 
+    # pgSTAC's version is only checked once per process, as loaders are created
+    # for every batch of items.
+    version_checked = False
+
+    # Collections that items have been loaded into, until taken to be refreshed
+    touched_collections: Set[str] = set()
+
     def __init__(self, db) -> None:
         super().__init__(db)
         self.check_version()
         self.conn = self.db.connect()
 
+    def check_version(self) -> None:
+        if not Loader.version_checked:
+            super().check_version()
+            Loader.version_checked = True
+
+    def load_partition(
+        self,
+        partition: Partition,
+        items: Iterable[Dict[str, Any]],
+        insert_mode: Optional[Methods] = Methods.insert,
+    ) -> None:
+        super().load_partition(partition, items, insert_mode)
+        Loader.touched_collections.add(partition.collection)
+
+    def load_items(
+        self,
+        file: Union[Path, str, Iterator[Any]] = "stdin",
+        insert_mode: Optional[Methods] = Methods.insert,
+        dehydrated: Optional[bool] = False,
+        chunksize: Optional[int] = 10000,
+        strategy: LoadStrategy = LoadStrategy.partitions,
+    ) -> None:
+        if strategy == LoadStrategy.staging and insert_mode in STAGING_TABLES:
+            self.load_items_staged(file, insert_mode)
+        else:
+            super().load_items(file, insert_mode, dehydrated, chunksize)
+
+    def load_items_staged(
+        self, items: Iterable[Dict[str, Any]], insert_mode: Methods
+    ) -> None:
+        """
+        Copy items into pgSTAC's staging table for the load method, whose trigger
+        creates their partitions, dehydrates them and merges them into the items
+        table as a single statement. The statistics of the partitions they land
+        in are then updated, as pypgstac does after loading each partition.
+        """
+        table = STAGING_TABLES[insert_mode]
+        item_ids: Dict[str, List[str]] = defaultdict(list)
+        with self.conn.cursor() as cur:
+            with self.conn.transaction():
+                with cur.copy(f"COPY pgstac.{table} (content) FROM stdin;") as copy:
+                    for item in items:
+                        item_ids[item["collection"]].append(item["id"])
+                        copy.write_row((orjson.dumps(item).decode(),))
+                logger.debug(f"Copied {cur.rowcount} rows into {table}")
+                # pgSTAC's trigger only clears items_staging
+                cur.execute(f"DELETE FROM pgstac.{table};")
+                # The trigger only updates the statistics of partitions it creates
+                # or widens, and before the items are inserted into them
+                for collection_id, ids in item_ids.items():
+                    cur.execute(
+                        """
+                        SELECT pgstac.update_partition_stats_q(partition)
+                        FROM (
+                            SELECT DISTINCT tableoid::regclass::text AS partition
+                            FROM pgstac.items
+                            WHERE collection = %s AND id = ANY(%s)
+                        ) AS loaded;
+                        """,
+                        [collection_id, ids],
+                    )
+        Loader.touched_collections.update(item_ids)
+
+    def transaction(self) -> ContextManager:
+        """
+        Load items within a single transaction, as pypgstac otherwise commits each
+        partition that it loads separately.
+        """
+        return self.conn.transaction()
+
+    @classmethod
+    def take_touched_collections(cls) -> Set[str]:
+        """Collections loaded into since last taken"""
+        touched, cls.touched_collections = cls.touched_collections, set()
+        return touched
+
+    @contextmanager
+    def partition_lock(
+        self, collection_id: str, partition: Optional[str], timeout: float
+    ) -> Iterator[bool]:
+        """
+        Hold an advisory lock on a collection's partition, so that concurrent
+        loaders take turns loading into it rather than contending for its row
+        locks. Waits up to `timeout` seconds for the lock, or only tries it once
+        if `timeout` is 0, yielding whether it was acquired.
+        """
+        key = f"{collection_id}:{partition or ''}"
+        deadline = time.monotonic() + timeout
+        delay = 0.05
+        while True:
+            with self.conn.cursor() as cur:
+                cur.execute(
+                    "SELECT pg_try_advisory_lock(hashtext(%s), hashtext(%s));",
+                    [LOCK_NAMESPACE, key],
+                )
+                locked = cur.fetchone()[0]
+            if locked or time.monotonic() + delay > deadline:
+                break
+            time.sleep(delay)
+            delay = min(delay * 2, 1)
+
+        try:
+            yield locked
+        finally:
+            # Locks are released along with the session should the connection fail
+            if locked and not self.conn.closed:
+                with self.conn.cursor() as cur:
+                    cur.execute(
+                        "SELECT pg_advisory_unlock(hashtext(%s), hashtext(%s));",
+                        [LOCK_NAMESPACE, key],
+                    )
+
     def delete_collection(self, collection_id: str) -> None:
         with self.conn.cursor() as cur:
             with self.conn.transaction():
                 logger.info(f"Deleting collection: {collection_id}.")
                 cur.execute("SELECT pgstac.delete_collection(%s);", [collection_id])
+
+    def update_collection_summaries(self, collection_id: str) -> None:
+        """
+        Update a collection's spatial and temporal extents from the recomputed
+        statistics of its partitions, and recompute the ranges and values of its
+        existing summaries from its items.
+        """
+        with self.conn.cursor() as cur:
+            with self.conn.transaction():
+                logger.info(f"Updating summaries of collection: {collection_id}.")
+                cur.execute(
+                    """
+                    UPDATE pgstac.collections
+                    SET content = content
+                        || coalesce(pgstac.collection_extent(id, true), '{}'::jsonb)
+                    WHERE id = %s
+                    RETURNING content->'summaries';
+                    """,
+                    [collection_id],
+                )
+                row = cur.fetchone()
+                if not row or not row[0]:
+                    return
+
+                summaries = row[0]
+                for name, summary in summaries.items():
+                    if isinstance(summary, dict) and "minimum" in summary:
+                        summaries[name] = self._summary_range(cur, collection_id, name)
+                    elif isinstance(summary, list):
+                        summaries[name] = self._summary_values(cur, collection_id, name)
+
+                cur.execute(
+                    """
+                    UPDATE pgstac.collections
+                    SET content = jsonb_set(content, '{summaries}', %s)
+                    WHERE id = %s;
+                    """,
+                    [Jsonb(summaries), collection_id],
+                )
+
+    @staticmethod
+    def _summary_range(cur, collection_id: str, name: str) -> Dict[str, Any]:
+        summary = {}
+        for bound, order in (("minimum", "ASC"), ("maximum", "DESC")):
+            cur.execute(
+                f"""
+                SELECT content->'properties'->%s AS value
+                FROM pgstac.items
+                WHERE collection = %s AND content->'properties' ? %s
+                ORDER BY value {order}
+                LIMIT 1;
+                """,
+                [name, collection_id, name],
+            )
+            row = cur.fetchone()
+            summary[bound] = row[0] if row else None
+        return summary
+
+    @staticmethod
+    def _summary_values(cur, collection_id: str, name: str) -> list:
+        cur.execute(
+            """
+            SELECT DISTINCT content->'properties'->%s
+            FROM pgstac.items
+            WHERE collection = %s AND content->'properties' ? %s
+            LIMIT %s;
+            """,
+            [name, collection_id, name, MAX_SUMMARY_VALUES],
+        )
+        return [row[0] for row in cur.fetchall()]
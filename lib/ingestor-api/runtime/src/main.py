@@ -1,7 +1,25 @@
-from fastapi import Depends, FastAPI, HTTPException
+import json
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, AsyncIterator, Dict, Iterator, List, Tuple, Union
+from urllib.parse import urlparse
+
+import orjson
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError, error_wrappers
+from pypgstac.load import Methods
 
 from . import collection as collection_loader
-from . import config, dependencies, schemas, services
+from . import config, dependencies, schemas, services, validators
+from .utils import aiter_lines
+
+NDJSON = "application/x-ndjson"
+NDJSON_SPOOL_SIZE = 1024 * 1024
 
 app = FastAPI(
     root_path=config.settings.root_path,
@@ -9,13 +27,45 @@ app = FastAPI(
 )
 
 
-@app.get("/ingestions", response_model=schemas.ListIngestionResponse, tags=["Ingestion"])
+@app.get(
+    "/ingestions",
+    response_model=Union[schemas.ListIngestionResponse, schemas.CountIngestionResponse],
+    tags=["Ingestion"],
+)
 async def list_ingestions(
     list_request: schemas.ListIngestionRequest = Depends(),
     db: services.Database = Depends(dependencies.get_db),
 ):
     return db.fetch_many(
-        status=list_request.status, next=list_request.next, limit=list_request.limit
+        status=list_request.status,
+        next=list_request.next,
+        limit=list_request.limit,
+        view=list_request.view,
+        since=list_request.since,
+        until=list_request.until,
+        order=list_request.order,
+    )
+
+
+@app.get(
+    "/users/me/ingestions",
+    response_model=Union[schemas.ListIngestionResponse, schemas.CountIngestionResponse],
+    tags=["Ingestion"],
+)
+async def list_user_ingestions(
+    list_request: schemas.ListUserIngestionRequest = Depends(),
+    db: services.Database = Depends(dependencies.get_db),
+    username: str = Depends(dependencies.get_username),
+):
+    return db.fetch_for_user(
+        username=username,
+        status=list_request.status,
+        next=list_request.next,
+        limit=list_request.limit,
+        view=list_request.view,
+        since=list_request.since,
+        until=list_request.until,
+        order=list_request.order,
     )
 
 
@@ -24,20 +74,293 @@ async def list_ingestions(
     response_model=schemas.Ingestion,
     tags=["Ingestion"],
     status_code=201,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"$ref": "#/components/schemas/Item"},
+                },
+                NDJSON: {
+                    "schema": {
+                        "type": "string",
+                        "description": "STAC items, one JSON document per line",
+                    },
+                },
+            },
+        },
+    },
 )
 async def create_ingestion(
-    item: schemas.AccessibleItem,
+    request: Request,
     username: str = Depends(dependencies.get_username),
     db: services.Database = Depends(dependencies.get_db),
-) -> schemas.Ingestion:
+    method: Methods = Depends(dependencies.get_load_method),
+):
+    """
+    Queue an item for ingestion. Bodies of type `application/x-ndjson` are
+    validated and queued line by line, streaming back a result for each line.
+    """
+    if request.headers.get("content-type", "").startswith(NDJSON):
+        return StreamingResponse(
+            await stream_ingestions(
+                aiter_lines(request.stream()), username=username, db=db, method=method
+            ),
+            media_type=NDJSON,
+        )
+
+    try:
+        item = schemas.AccessibleItem.parse_raw(await request.body())
+    except ValidationError as e:
+        raise RequestValidationError([error_wrappers.ErrorWrapper(e, ("body",))]) from e
+
     return schemas.Ingestion(
         id=item.id,
         created_by=username,
         item=item,
         status=schemas.Status.queued,
+        method=method,
+    ).enqueue(db)
+
+
+def queue_items(
+    items: List[Dict[str, Any]],
+    username: str,
+    db: services.Database,
+    method: Methods = Methods.upsert,
+) -> List[schemas.BulkIngestionResult]:
+    """
+    Validate items and queue those that are valid, returning the outcome for each.
+    """
+    results = []
+    ingestions = []
+    for item, parsed in zip(
+        items,
+        schemas.parse_accessible_items(
+            items, max_workers=config.settings.item_validation_concurrency
+        ),
+    ):
+        if isinstance(parsed, ValidationError):
+            results.append(
+                schemas.BulkIngestionResult(
+                    id=item.get("id") if isinstance(item.get("id"), str) else None,
+                    status=schemas.Status.failed,
+                    message="Item failed validation",
+                    errors=parsed.errors(),
+                )
+            )
+            continue
+
+        ingestion = schemas.Ingestion(
+            id=parsed.id,
+            created_by=username,
+            item=parsed,
+            status=schemas.Status.queued,
+            method=method,
+        )
+        ingestions.append(ingestion)
+        results.append(
+            schemas.BulkIngestionResult(id=ingestion.id, status=ingestion.status)
+        )
+
+    db.write_many(ingestions, max_workers=config.settings.item_staging_concurrency)
+    return results
+
+
+async def stream_ingestions(
+    lines: AsyncIterator[bytes],
+    username: str,
+    db: services.Database,
+    method: Methods = Methods.upsert,
+) -> Iterator[bytes]:
+    """
+    Queue NDJSON items in batches of DynamoDB's maximum batch write size, holding
+    no more than one batch of items in memory. Per-line results are spooled to
+    disk once large, to be streamed back once the request body is consumed.
+    """
+    results = tempfile.SpooledTemporaryFile(max_size=NDJSON_SPOOL_SIZE)
+
+    async def flush(batch: List[Tuple[int, Union[Dict, schemas.BulkIngestionResult]]]):
+        items = [item for _, item in batch if isinstance(item, dict)]
+        queued = iter(
+            await run_in_threadpool(
+                queue_items, items, username=username, db=db, method=method
+            )
+        )
+        for line_number, item in batch:
+            result = next(queued) if isinstance(item, dict) else item
+            result.line = line_number
+            results.write(result.json(exclude_none=True).encode() + b"\n")
+
+    batch = []
+    line_number = 0
+    async for line in lines:
+        line_number += 1
+        if not line.strip():
+            continue
+
+        try:
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise ValueError("Expected a JSON object")
+        except ValueError as e:
+            item = schemas.BulkIngestionResult(
+                status=schemas.Status.failed,
+                message=f"Unable to parse line: {e}",
+            )
+
+        batch.append((line_number, item))
+        if len(batch) == services.BATCH_WRITE_SIZE:
+            await flush(batch)
+            batch = []
+
+    if batch:
+        await flush(batch)
+
+    def iter_results():
+        with results:
+            results.seek(0)
+            yield from results
+
+    return iter_results()
+
+
+@app.post(
+    "/ingestions/bulk",
+    response_model=schemas.BulkIngestionResponse,
+    response_model_exclude_none=True,
+    tags=["Ingestion"],
+)
+def create_bulk_ingestion(
+    items: Union[List[Dict[str, Any]], schemas.ItemCollectionRequest],
+    username: str = Depends(dependencies.get_username),
+    db: services.Database = Depends(dependencies.get_db),
+    method: Methods = Depends(dependencies.get_load_method),
+):
+    """
+    Queue many items for ingestion. Items failing validation are reported without
+    preventing the remaining items from being queued.
+    """
+    if isinstance(items, schemas.ItemCollectionRequest):
+        items = items.features
+
+    if len(items) > config.settings.bulk_ingestion_max_items:
+        raise HTTPException(
+            status_code=413,
+            detail=(
+                "Unable to ingest more than "
+                f"{config.settings.bulk_ingestion_max_items} items per request"
+            ),
+        )
+
+    return {"items": queue_items(items, username=username, db=db, method=method)}
+
+
+@app.post(
+    "/ingestions/manifests",
+    response_model=schemas.Ingestion,
+    tags=["Ingestion"],
+    status_code=201,
+)
+def create_manifest_ingestion(
+    manifest: schemas.ManifestIngestionRequest,
+    username: str = Depends(dependencies.get_username),
+    db: services.Database = Depends(dependencies.get_db),
+    method: Methods = Depends(dependencies.get_load_method),
+) -> schemas.Ingestion:
+    """
+    Queue the items of an NDJSON file in S3 (optionally gzipped) for ingestion.
+    """
+    return schemas.Ingestion(
+        id=str(uuid.uuid4()),
+        created_by=username,
+        manifest=schemas.Manifest(url=manifest.url),
+        status=schemas.Status.queued,
+        method=method,
     ).enqueue(db)
 
 
+@app.post(
+    "/ingestions/export",
+    response_model=schemas.ExportResponse,
+    tags=["Ingestion"],
+    responses={200: {"content": {NDJSON: {}}}},
+)
+def export_ingestions(
+    export_request: schemas.ExportRequest,
+    db: services.Database = Depends(dependencies.get_db),
+    username: str = Depends(dependencies.get_admin_username),
+):
+    """
+    Export every ingestion as NDJSON, scanning segments of the table in parallel.
+    Each page of a segment is written to its own object under the requested S3
+    prefix or, without one, streamed back followed by a line reporting progress.
+    Exports stop once time runs short, or once the response is full; resume them
+    by requesting the export again with the returned segments.
+    """
+    deadline = time.monotonic() + config.settings.export_time_limit
+
+    def export(write):
+        segments = db.export(
+            export_request.segments,
+            export_request.total_segments,
+            write=write,
+            deadline=deadline,
+            page_size=export_request.page_size,
+            max_workers=config.settings.export_concurrency,
+        )
+        return schemas.ExportResponse(
+            url=export_request.url,
+            total_segments=export_request.total_segments,
+            segments=segments,
+            complete=all(s.complete for s in segments),
+        )
+
+    def to_ndjson(records: List[Dict[str, Any]]) -> bytes:
+        return b"".join(orjson.dumps(record) + b"\n" for record in records)
+
+    if export_request.url:
+        url = urlparse(export_request.url)
+        prefix = url.path.strip("/")
+        client = dependencies.get_staging_client()
+
+        def write_to_s3(segment: schemas.ExportSegment, records: List[Dict]):
+            # Named by offset, so that resumed exports overwrite rather than repeat
+            offset = segment.exported - len(records)
+            client.put_object(
+                Bucket=url.hostname,
+                Key=f"{prefix}/segment-{segment.segment:04d}/{offset:012d}.ndjson",
+                Body=to_ndjson(records),
+                ContentType=NDJSON,
+            )
+
+        return export(write_to_s3)
+
+    results = tempfile.SpooledTemporaryFile(max_size=NDJSON_SPOOL_SIZE)
+    lock = threading.Lock()
+    max_bytes = config.settings.export_response_max_bytes
+
+    def write_to_response(segment: schemas.ExportSegment, records: List[Dict]):
+        lines = to_ndjson(records)
+        with lock:
+            # Always accept a first page, so that exports make progress
+            written = results.tell()
+            if written and written + len(lines) > max_bytes:
+                return False
+            results.write(lines)
+        return True
+
+    progress = export(write_to_response)
+
+    def iter_results():
+        with results:
+            results.seek(0)
+            yield from results
+        yield progress.json().encode() + b"\n"
+
+    return StreamingResponse(iter_results(), media_type=NDJSON)
+
+
 @app.get(
     "/ingestions/{ingestion_id}",
     response_model=schemas.Ingestion,
@@ -88,10 +411,14 @@ def cancel_ingestion(
     status_code=201,
     dependencies=[Depends(dependencies.get_username)],
 )
-def publish_collection(collection: schemas.StacCollection):
+def publish_collection(
+    collection: schemas.StacCollection,
+    method: Methods = Depends(dependencies.get_collection_load_method),
+):
     # pgstac create collection
     try:
-        collection_loader.ingest(collection)
+        collection_loader.ingest(collection, method=method)
+        validators.invalidate_collection(collection.id)
         return {f"Successfully published: {collection.id}"}
     except Exception as e:
         raise HTTPException(
@@ -108,6 +435,7 @@ def publish_collection(collection: schemas.StacCollection):
 def delete_collection(collection_id: str):
     try:
         collection_loader.delete(collection_id=collection_id)
+        validators.invalidate_collection(collection_id)
         return {f"Successfully deleted: {collection_id}"}
     except Exception as e:
         print(e)
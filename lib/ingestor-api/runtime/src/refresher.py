@@ -0,0 +1,49 @@
+"""
+Refreshes the extents and summaries of collections that items have been loaded
+into, running on a schedule so that each collection is refreshed at most once
+per interval however many batches of items are loaded into it.
+"""
+
+import os
+import time
+from typing import TYPE_CHECKING
+
+from . import services
+from .config import settings
+from .dependencies import get_collection_refresh_table
+from .loader import Loader
+from .utils import emit_metric, get_db_credentials, pgstac_connection
+
+if TYPE_CHECKING:
+    from aws_lambda_typing import context as context_
+    from aws_lambda_typing import events
+
+
+def handler(event: "events.EventBridgeEvent", context: "context_.Context"):
+    refreshes = services.CollectionRefreshes(get_collection_refresh_table(settings))
+    pending = refreshes.pending()
+    if not pending:
+        print("No collections to refresh")
+        return
+
+    loader = Loader(
+        db=pgstac_connection.get(get_db_credentials(os.environ["DB_SECRET_ARN"]))
+    )
+    for collection_id, touched_at in pending:
+        start = time.perf_counter()
+        try:
+            loader.update_collection_summaries(collection_id)
+        except Exception as e:
+            print(f"Encountered failure refreshing collection {collection_id}: {e}")
+            continue
+
+        duration = time.perf_counter() - start
+        print(f"Refreshed collection {collection_id} in {duration:.2f}s")
+        emit_metric(
+            settings.metrics_namespace,
+            "CollectionRefreshDuration",
+            duration,
+            "Seconds",
+            Collection=collection_id,
+        )
+        refreshes.mark_refreshed(collection_id, touched_at)
@@ -1,22 +1,31 @@
 import base64
 import binascii
 import enum
+import gzip
 import json
-from datetime import datetime
-from typing import TYPE_CHECKING, Dict, List, Optional, Union
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Literal, Optional, Union
 from urllib.parse import urlparse
 
+import orjson
+import zstandard
+from boto3.dynamodb.types import Binary, TypeDeserializer
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from pydantic import (
     BaseModel,
     Json,
     PositiveInt,
+    ValidationError,
     dataclasses,
     error_wrappers,
+    root_validator,
     validator,
 )
-from stac_pydantic import Collection, Item, shared
+from pydantic.json import pydantic_encoder
+from pypgstac.load import Methods
+from stac_pydantic import Collection, Item
 
 from . import validators
 
@@ -24,31 +33,68 @@ if TYPE_CHECKING:
     from . import services
 
 
-class AccessibleAsset(shared.Asset):
-    @validator("href")
-    def is_accessible(cls, href):
-        url = urlparse(href)
-
-        if url.scheme in ["https", "http"]:
-            validators.url_is_accessible(href=href)
-        elif url.scheme in ["s3"]:
-            validators.s3_object_is_accessible(
-                bucket=url.hostname, key=url.path.lstrip("/")
-            )
-        else:
-            ValueError(f"Unsupported scheme: {url.scheme}")
-
-        return href
-
-
 class AccessibleItem(Item):
-    assets: Dict[str, AccessibleAsset]
-
     @validator("collection")
     def exists(cls, collection):
         validators.collection_exists(collection_id=collection)
         return collection
 
+    @validator("assets")
+    def are_accessible(cls, assets):
+        """
+        Check all asset hrefs at once rather than one asset at a time, reporting
+        errors against each inaccessible asset's href.
+        """
+        errors = validators.assets_are_accessible(
+            {name: asset.href for name, asset in assets.items()}
+        )
+        if errors:
+            raise ValidationError(
+                [
+                    error_wrappers.ErrorWrapper(error, (name, "href"))
+                    for name, error in errors.items()
+                ],
+                cls,
+            )
+        return assets
+
+
+def parse_accessible_items(
+    items: List[Dict[str, Any]], max_workers: int
+) -> List[Union[AccessibleItem, ValidationError]]:
+    """
+    Concurrently validate items, returning either the parsed item or the validation
+    error for each item, in order.
+    """
+    # look up every collection at once so that item validation hits the cache,
+    # reusing the errors of lookups that weren't cached, e.g. as the STAC API
+    # couldn't be reached
+    collection_errors = validators.check_collections(
+        {item["collection"] for item in items if isinstance(item.get("collection"), str)}
+    )
+
+    def parse(item: Dict[str, Any]) -> Union[AccessibleItem, ValidationError]:
+        collection_id = item.get("collection")
+        if isinstance(collection_id, str) and collection_id in collection_errors:
+            return ValidationError(
+                [
+                    error_wrappers.ErrorWrapper(
+                        ValueError(collection_errors[collection_id]), ("collection",)
+                    )
+                ],
+                AccessibleItem,
+            )
+        try:
+            return AccessibleItem.parse_obj(item)
+        except ValidationError as e:
+            return e
+
+    if not items:
+        return []
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items))) as executor:
+        return list(executor.map(parse, items))
+
 
 class StacCollection(Collection):
     id: str
@@ -63,7 +109,85 @@ class Status(str, enum.Enum):
     cancelled = "cancelled"
 
 
-class Ingestion(BaseModel):
+class SortOrder(str, enum.Enum):
+    asc = "asc"
+    desc = "desc"
+
+
+class IngestionView(str, enum.Enum):
+    full = "full"
+    summary = "summary"
+    count = "count"
+
+
+def is_s3_url(url: str) -> str:
+    parsed = urlparse(url)
+    if parsed.scheme != "s3" or not parsed.hostname or not parsed.path.strip("/"):
+        raise ValueError(f"Expected a URL of the form s3://bucket/key, got {url}")
+    return url
+
+
+class Manifest(BaseModel):
+    """
+    NDJSON file of STAC items in S3, optionally gzipped, loaded in chunks.
+    """
+
+    url: str
+    # bytes of the (uncompressed) file whose items have been loaded
+    offset: int = 0
+    items_loaded: int = 0
+
+    _is_s3_url = validator("url", allow_reuse=True)(is_s3_url)
+
+    @property
+    def bucket(self) -> str:
+        return urlparse(self.url).hostname
+
+    @property
+    def key(self) -> str:
+        return urlparse(self.url).path.lstrip("/")
+
+    @property
+    def compressed(self) -> bool:
+        return self.key.endswith(".gz")
+
+
+class ManifestIngestionRequest(BaseModel):
+    url: str
+
+    _is_s3_url = validator("url", allow_reuse=True)(is_s3_url)
+
+    @validator("url")
+    def is_accessible(cls, url):
+        parsed = urlparse(url)
+        validators.manifest_is_accessible(
+            bucket=parsed.hostname, key=parsed.path.lstrip("/")
+        )
+        return url
+
+
+ItemCompression = Literal["gzip", "zstd"]
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+
+def compress_item(item: str, compression: ItemCompression) -> bytes:
+    """Compress a serialized STAC item"""
+    if compression == "zstd":
+        return zstandard.compress(item.encode(), level=3)
+    return gzip.compress(item.encode(), compresslevel=6)
+
+
+def decompress_item(data: Union[bytes, Binary]) -> str:
+    """Decompress a serialized STAC item, detecting how it was compressed"""
+    if isinstance(data, Binary):
+        data = data.value
+    if data.startswith(ZSTD_MAGIC):
+        return zstandard.decompress(data).decode()
+    return gzip.decompress(data).decode()
+
+
+class IngestionSummary(BaseModel):
     id: str
     status: Status
     message: Optional[str]
@@ -71,13 +195,34 @@ class Ingestion(BaseModel):
     created_at: datetime = None
     updated_at: datetime = None
 
-    item: Union[Item, Json[Item]]
-
     @validator("created_at", pre=True, always=True, allow_reuse=True)
     @validator("updated_at", pre=True, always=True, allow_reuse=True)
     def set_ts_now(cls, v):
         return v or datetime.now()
 
+
+class Ingestion(IngestionSummary):
+    # STAC item, left as its serialized JSON when loaded via `from_dynamodb`
+    item: Optional[Union[Item, Json[Item]]] = None
+    # URL of a STAC item staged in S3 as it was too large to store in DynamoDB
+    item_url: Optional[str] = None
+    manifest: Optional[Manifest] = None
+    # How the STAC item(s) are loaded into pgSTAC
+    method: Methods = Methods.upsert
+
+    @validator("item", pre=True)
+    def decompress(cls, v):
+        if isinstance(v, (bytes, Binary)):
+            return decompress_item(v)
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def has_item_or_manifest(cls, values):
+        sources = [values.get(k) for k in ("item", "item_url", "manifest")]
+        if sum(source is not None for source in sources) != 1:
+            raise ValueError("Ingestion requires exactly one of item or manifest")
+        return values
+
     def enqueue(self, db: "services.Database"):
         self.status = Status.queued
         return self.save(db)
@@ -91,16 +236,152 @@ class Ingestion(BaseModel):
         db.write(self)
         return self
 
-    def dynamodb_dict(self):
-        """DynamoDB-friendly serialization"""
+    @classmethod
+    def from_dynamodb(cls, record: Dict[str, Any]) -> "Ingestion":
+        """
+        Load an ingestion from its DynamoDB representation without validation,
+        leaving its STAC item as the JSON string it was stored as.
+        """
+        item = record.get("item")
+        return cls.construct(
+            **{
+                **record,
+                "status": Status(record["status"]),
+                "method": Methods(record.get("method", Methods.upsert)),
+                "item": (
+                    decompress_item(item) if isinstance(item, (bytes, Binary)) else item
+                ),
+                "manifest": (
+                    Manifest.parse_obj(record["manifest"])
+                    if record.get("manifest")
+                    else None
+                ),
+            }
+        )
+
+    def item_dict(self) -> Dict[str, Any]:
+        """STAC item as a JSON-friendly dict"""
+        if isinstance(self.item, str):
+            return orjson.loads(self.item)
+        return jsonable_encoder(self.item)
+
+    def item_json(self) -> str:
+        """STAC item as a JSON string"""
+        if isinstance(self.item, str):
+            return self.item
+        return orjson.dumps(
+            self.item.dict(by_alias=True), default=pydantic_encoder
+        ).decode()
+
+    def dynamodb_dict(self, compression: Optional[ItemCompression] = None):
+        """
+        DynamoDB-friendly serialization, optionally storing the STAC item as
+        compressed binary.
+        """
         # convert to dictionary
         output = self.dict(exclude={"item"})
 
-        # add STAC item as string
-        output["item"] = self.item.json()
-
         # make JSON-friendly (will be able to do with Pydantic V2, https://github.com/pydantic/pydantic/issues/1409#issuecomment-1423995424)
-        return jsonable_encoder(output)
+        output = jsonable_encoder(output)
+
+        # add STAC item as string
+        if self.item is not None:
+            item = self.item_json()
+            output["item"] = compress_item(item, compression) if compression else item
+        return output
+
+
+class QueuedIngestion:
+    """
+    Queued ingestion decoded directly from the attribute values of a DynamoDB
+    stream record, holding its STAC item as the raw JSON string it was stored as.
+    Items staged in S3 are only referenced by `item_url` until fetched.
+    """
+
+    __slots__ = (
+        "sequence_number",
+        "id",
+        "created_by",
+        "created_at",
+        "item",
+        "item_url",
+        "manifest",
+        "method",
+    )
+
+    _deserializer = TypeDeserializer()
+
+    def __init__(
+        self,
+        id: str,
+        created_by: str,
+        created_at: str,
+        item: Optional[str] = None,
+        manifest: Optional[Dict[str, Any]] = None,
+        sequence_number: Optional[str] = None,
+        item_url: Optional[str] = None,
+        method: Methods = Methods.upsert,
+    ):
+        self.id = id
+        self.created_by = created_by
+        self.created_at = created_at
+        self.item = item
+        self.item_url = item_url
+        self.method = method
+        self.manifest = manifest
+        self.sequence_number = sequence_number
+
+    @classmethod
+    def from_stream_record(cls, record: Dict[str, Any]) -> Optional["QueuedIngestion"]:
+        """
+        Decode a stream record, returning None without decoding the rest of the
+        record if the ingestion isn't queued.
+        """
+        image = record["dynamodb"].get("NewImage", {})
+        if image.get("status", {}).get("S") != Status.queued:
+            return None
+
+        return cls(
+            id=image["id"]["S"],
+            created_by=image["created_by"]["S"],
+            created_at=image["created_at"]["S"],
+            item=cls._decode_item(image.get("item", {})),
+            item_url=image.get("item_url", {}).get("S"),
+            method=Methods(image.get("method", {}).get("S", Methods.upsert)),
+            manifest=(
+                cls._deserializer.deserialize(image["manifest"])
+                if "M" in image.get("manifest", {})
+                else None
+            ),
+            sequence_number=record["dynamodb"].get("SequenceNumber"),
+        )
+
+    @staticmethod
+    def _decode_item(value: Dict[str, str]) -> Optional[str]:
+        if "S" in value:
+            return value["S"]
+        # binary attributes are base64 encoded in stream records
+        if "B" in value:
+            return decompress_item(base64.b64decode(value["B"]))
+        return None
+
+    def item_dict(self) -> Dict[str, Any]:
+        """STAC item as a JSON-friendly dict"""
+        return orjson.loads(self.item)
+
+    def to_ingestion(self) -> Ingestion:
+        return Ingestion.from_dynamodb(
+            {
+                "id": self.id,
+                "created_by": self.created_by,
+                "created_at": self.created_at,
+                "status": Status.queued,
+                "item": self.item,
+                "item_url": self.item_url if self.item is None else None,
+                "manifest": self.manifest,
+                "method": self.method,
+            }
+        )
 
 
 @dataclasses.dataclass
@@ -108,8 +389,26 @@ class ListIngestionRequest:
     status: Status = Status.queued
     limit: PositiveInt = None
     next: Optional[str] = None
+    view: IngestionView = IngestionView.full
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    order: SortOrder = SortOrder.asc
 
     def __post_init_post_parse__(self) -> None:
+        # Timestamps are stored as naive UTC
+        self.since, self.until = (
+            dt.astimezone(timezone.utc).replace(tzinfo=None) if dt and dt.tzinfo else dt
+            for dt in (self.since, self.until)
+        )
+        if self.since and self.until and self.since > self.until:
+            raise RequestValidationError(
+                [
+                    error_wrappers.ErrorWrapper(
+                        ValueError("since must not be after until"), "query.since"
+                    )
+                ]
+            )
+
         # https://github.com/tiangolo/fastapi/issues/1474#issuecomment-1049987786
         if self.next is None:
             return
@@ -129,18 +428,92 @@ class ListIngestionRequest:
             ) from e
 
 
+@dataclasses.dataclass
+class ListUserIngestionRequest(ListIngestionRequest):
+    status: Optional[Status] = None
+
+
+def b64_encode_next(next: Any) -> Any:
+    """
+    Base64 encode next parameter for easier transportability
+    """
+    if isinstance(next, dict):
+        return base64.b64encode(json.dumps(next).encode())
+    return next
+
+
 class ListIngestionResponse(BaseModel):
-    items: List[Ingestion]
+    items: List[Union[Ingestion, IngestionSummary]]
     next: Optional[str]
 
-    @validator("next", pre=True)
-    def b64_encode_next(cls, next):
-        """
-        Base64 encode next parameter for easier transportability
-        """
-        if isinstance(next, dict):
-            return base64.b64encode(json.dumps(next).encode())
-        return next
+    _b64_encode_next = validator("next", pre=True, allow_reuse=True)(b64_encode_next)
+
+
+class CountIngestionResponse(BaseModel):
+    count: int
+    next: Optional[str]
+
+    _b64_encode_next = validator("next", pre=True, allow_reuse=True)(b64_encode_next)
+
+
+class ExportSegment(BaseModel):
+    segment: int
+    exported: int = 0
+    # Encoded key from which to resume scanning the segment
+    next: Optional[str] = None
+    complete: bool = False
+
+    _b64_encode_next = validator("next", pre=True, allow_reuse=True)(b64_encode_next)
+
+    @property
+    def start_key(self) -> Optional[Dict[str, Any]]:
+        return json.loads(base64.b64decode(self.next)) if self.next else None
+
+
+class ExportRequest(BaseModel):
+    # S3 prefix to which to export, exporting to the response if unset
+    url: Optional[str] = None
+    total_segments: PositiveInt = 4
+    page_size: Optional[PositiveInt] = None
+    # Progress of a previous export to resume
+    segments: Optional[List[ExportSegment]] = None
+
+    _is_s3_url = validator("url", allow_reuse=True)(is_s3_url)
+
+    @validator("segments", always=True)
+    def has_each_segment(cls, segments, values):
+        if "total_segments" not in values:
+            return segments
+        total_segments = values["total_segments"]
+        if segments is None:
+            return [ExportSegment(segment=n) for n in range(total_segments)]
+        if sorted(s.segment for s in segments) != list(range(total_segments)):
+            raise ValueError("Expected progress for each segment of the export")
+        return segments
+
+
+class ExportResponse(BaseModel):
+    url: Optional[str]
+    total_segments: int
+    segments: List[ExportSegment]
+    complete: bool
+
+
+class ItemCollectionRequest(BaseModel):
+    type: Literal["FeatureCollection"]
+    features: List[Dict[str, Any]]
+
+
+class BulkIngestionResult(BaseModel):
+    line: Optional[int]
+    id: Optional[str]
+    status: Status
+    message: Optional[str]
+    errors: Optional[List[Dict[str, Any]]]
+
+
+class BulkIngestionResponse(BaseModel):
+    items: List[BulkIngestionResult]
 
 
 class UpdateIngestionRequest(BaseModel):
@@ -1,44 +1,426 @@
-from typing import TYPE_CHECKING, List
+import functools
+import gzip
+import operator
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 from boto3.dynamodb import conditions
+from fastapi.encoders import jsonable_encoder
 from pydantic import parse_obj_as
 
 from . import schemas
 
 if TYPE_CHECKING:
     from mypy_boto3_dynamodb.service_resource import Table
+    from mypy_boto3_s3.client import S3Client
+
+# Maximum number of items in a DynamoDB BatchWriteItem request
+BATCH_WRITE_SIZE = 25
+
+
+class ItemStore:
+    """
+    Stages STAC items too large to store in DynamoDB as gzipped JSON in S3.
+    """
+
+    def __init__(
+        self, client: "S3Client", bucket: Optional[str] = None, threshold: int = 0
+    ):
+        self.client = client
+        self.bucket = bucket
+        self.threshold = threshold
+
+    def should_stage(self, item: Union[str, bytes]) -> bool:
+        size = len(item) if isinstance(item, bytes) else len(item.encode())
+        return self.bucket is not None and size > self.threshold
+
+    def put(self, ingestion: schemas.Ingestion, item: str) -> str:
+        """Stage a STAC item, returning its URL"""
+        # Keys are unique so that re-ingestions don't replace items still queued
+        key = f"items/{ingestion.created_by}/{ingestion.id}/{uuid.uuid4()}.json.gz"
+        self.client.put_object(
+            Bucket=self.bucket,
+            Key=key,
+            Body=gzip.compress(item.encode()),
+            ContentType="application/json",
+            ContentEncoding="gzip",
+        )
+        return f"s3://{self.bucket}/{key}"
+
+    def get(self, url: str) -> str:
+        """Fetch a staged STAC item as a JSON string"""
+        bucket, _, key = url.removeprefix("s3://").partition("/")
+        body = self.client.get_object(Bucket=bucket, Key=key)["Body"].read()
+        return gzip.decompress(body).decode()
+
+    def get_many(self, urls: Sequence[str], max_workers: int = 16) -> List[str]:
+        """Concurrently fetch staged STAC items"""
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(urls))) as ex:
+            return list(ex.map(self.get, urls))
 
 
 class Database:
-    def __init__(self, table: "Table"):
+    def __init__(
+        self,
+        table: "Table",
+        item_store: Optional[ItemStore] = None,
+        item_compression: Optional[schemas.ItemCompression] = None,
+        summary_index: Optional[str] = None,
+    ):
         self.table = table
+        self.item_store = item_store
+        self.item_compression = item_compression
+        self.summary_index = summary_index
+
+    def to_record(self, ingestion: schemas.Ingestion) -> Dict[str, Any]:
+        """
+        Serialize an ingestion for DynamoDB, staging its STAC item in S3 if it's
+        too large to store inline, even once compressed.
+        """
+        record = ingestion.dynamodb_dict(compression=self.item_compression)
+        item = record.get("item")
+        if self.item_store and item and self.item_store.should_stage(item):
+            del record["item"]
+            record["item_url"] = self.item_store.put(ingestion, ingestion.item_json())
+        return record
 
     def write(self, ingestion: schemas.Ingestion):
-        self.table.put_item(Item=ingestion.dynamodb_dict())
+        self.table.put_item(Item=self.to_record(ingestion))
+
+    def write_many(self, ingestions: Sequence[schemas.Ingestion], max_workers: int = 16):
+        if self.item_store and self.item_store.bucket and ingestions:
+            # Stage large items concurrently
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(ingestions))) as ex:
+                records = list(ex.map(self.to_record, ingestions))
+        else:
+            records = [self.to_record(ingestion) for ingestion in ingestions]
+
+        with self.table.batch_writer(overwrite_by_pkeys=["created_by", "id"]) as batch:
+            for record in records:
+                batch.put_item(Item=record)
+
+    def transition(
+        self,
+        ingestion: Union[schemas.Ingestion, schemas.QueuedIngestion],
+        status: schemas.Status,
+        message: Optional[str] = None,
+        from_statuses: Sequence[schemas.Status] = (schemas.Status.queued,),
+        **attributes: Any,
+    ) -> bool:
+        """
+        Update the status of an ingestion, along with any other provided attributes,
+        if it currently has one of the expected statuses. Returns whether the
+        ingestion was updated.
+        """
+        values = jsonable_encoder(
+            {
+                "status": status,
+                "message": message,
+                "updated_at": datetime.now(),
+                **attributes,
+            }
+        )
+        client = self.table.meta.client
+        try:
+            # the resource's client is threadsafe, unlike the table resource
+            client.update_item(
+                TableName=self.table.name,
+                Key={"created_by": ingestion.created_by, "id": ingestion.id},
+                UpdateExpression="SET "
+                + ", ".join(f"#{name} = :{name}" for name in values),
+                ConditionExpression=conditions.Attr("status").is_in(
+                    [s.value for s in from_statuses]
+                ),
+                ExpressionAttributeNames={f"#{name}": name for name in values},
+                ExpressionAttributeValues={
+                    f":{name}": value for name, value in values.items()
+                },
+            )
+        except client.exceptions.ConditionalCheckFailedException:
+            return False
+        return True
+
+    def transition_many(
+        self,
+        ingestions: Sequence[Union[schemas.Ingestion, schemas.QueuedIngestion]],
+        status: schemas.Status,
+        message: Optional[str] = None,
+        from_statuses: Sequence[schemas.Status] = (schemas.Status.queued,),
+        max_workers: int = 16,
+        messages: Optional[Sequence[Optional[str]]] = None,
+    ) -> List[Union[schemas.Ingestion, schemas.QueuedIngestion]]:
+        """
+        Concurrently update the status of ingestions, with either the same message
+        or one message per ingestion. Returns the ingestions that weren't updated
+        as their status wasn't one of those expected.
+        """
+        if not ingestions:
+            return []
+        if messages is None:
+            messages = [message] * len(ingestions)
+
+        def transition(ingestion, message: Optional[str]) -> bool:
+            return self.transition(
+                ingestion, status, message=message, from_statuses=from_statuses
+            )
+
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(ingestions))) as ex:
+            updated = list(ex.map(transition, ingestions, messages))
+        return [i for i, was_updated in zip(ingestions, updated) if not was_updated]
 
     def fetch_one(self, username: str, ingestion_id: str):
         response = self.table.get_item(
             Key={"created_by": username, "id": ingestion_id},
         )
         try:
-            return schemas.Ingestion.parse_obj(response["Item"])
+            record = response["Item"]
         except KeyError as e:
             raise NotInDb("Record not found") from e
 
+        # Include staged STAC items, unless they have since expired
+        if self.item_store and record.get("item_url"):
+            try:
+                record["item"] = self.item_store.get(record["item_url"])
+                record["item_url"] = None
+            except self.item_store.client.exceptions.NoSuchKey:
+                pass
+        return schemas.Ingestion.parse_obj(record)
+
     def fetch_many(
-        self, status: str, next: dict = None, limit: int = None
-    ) -> schemas.ListIngestionResponse:
-        response = self.table.query(
-            IndexName="status",
-            KeyConditionExpression=conditions.Key("status").eq(status),
+        self,
+        status: str,
+        next: dict = None,
+        limit: int = None,
+        view: schemas.IngestionView = schemas.IngestionView.full,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: schemas.SortOrder = schemas.SortOrder.asc,
+    ) -> Union[schemas.ListIngestionResponse, schemas.CountIngestionResponse]:
+        """
+        List ingestions with a given status, created within an optional time
+        range. The summary view omits STAC items and manifests, while the count
+        view only counts the ingestions. Both read from the slim summary index if
+        available.
+        """
+        key_condition = conditions.Key("status").eq(status)
+        created_at = conditions.Key("created_at")
+        if since and until:
+            key_condition &= created_at.between(since.isoformat(), until.isoformat())
+        elif since:
+            key_condition &= created_at.gte(since.isoformat())
+        elif until:
+            key_condition &= created_at.lte(until.isoformat())
+
+        index = (
+            self.summary_index
+            if self.summary_index and view != schemas.IngestionView.full
+            else "status"
+        )
+        return self._query(
+            view,
+            IndexName=index,
+            KeyConditionExpression=key_condition,
+            ScanIndexForward=order == schemas.SortOrder.asc,
             **{"Limit": limit} if limit else {},
             **{"ExclusiveStartKey": next} if next else {},
         )
+
+    def fetch_for_user(
+        self,
+        username: str,
+        status: Optional[str] = None,
+        next: dict = None,
+        limit: int = None,
+        view: schemas.IngestionView = schemas.IngestionView.full,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        order: schemas.SortOrder = schemas.SortOrder.asc,
+    ) -> Union[schemas.ListIngestionResponse, schemas.CountIngestionResponse]:
+        """
+        List the ingestions of a user from their partition of the table, sorted
+        by ID. Status and creation time are applied as filters, so pages may
+        hold fewer ingestions than the limit.
+        """
+        filters = []
+        if status:
+            filters.append(conditions.Attr("status").eq(status))
+        if since:
+            filters.append(conditions.Attr("created_at").gte(since.isoformat()))
+        if until:
+            filters.append(conditions.Attr("created_at").lte(until.isoformat()))
+
+        return self._query(
+            view,
+            KeyConditionExpression=conditions.Key("created_by").eq(username),
+            ScanIndexForward=order == schemas.SortOrder.asc,
+            **{"FilterExpression": functools.reduce(operator.and_, filters)}
+            if filters
+            else {},
+            **{"Limit": limit} if limit else {},
+            # Keep users within their own partition
+            **{"ExclusiveStartKey": {**next, "created_by": username}} if next else {},
+        )
+
+    def _query(
+        self, view: schemas.IngestionView, **query: Any
+    ) -> Union[schemas.ListIngestionResponse, schemas.CountIngestionResponse]:
+        """
+        Query ingestions, returning either them or their summaries, or only
+        counting them. Counts read every page unless limited.
+        """
+        if view == schemas.IngestionView.count:
+            count = 0
+            while True:
+                response = self.table.query(**query, Select="COUNT")
+                count += response["Count"]
+                next = response.get("LastEvaluatedKey")
+                if "Limit" in query or not next:
+                    return {"count": count, "next": next}
+                query["ExclusiveStartKey"] = next
+
+        if view == schemas.IngestionView.summary:
+            fields = schemas.IngestionSummary.__fields__
+            query["ProjectionExpression"] = ", ".join(f"#{name}" for name in fields)
+            query["ExpressionAttributeNames"] = {f"#{name}": name for name in fields}
+            model = schemas.IngestionSummary
+        else:
+            model = schemas.Ingestion
+
+        response = self.table.query(**query)
         return {
-            "items": parse_obj_as(List[schemas.Ingestion], response["Items"]),
+            "items": parse_obj_as(List[model], response["Items"]),
             "next": response.get("LastEvaluatedKey"),
         }
 
+    def scan_segment(
+        self,
+        segment: schemas.ExportSegment,
+        total_segments: int,
+        page_size: Optional[int] = None,
+    ) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Scan a segment of the table a page at a time, resuming from and updating
+        the segment's progress.
+        """
+        # the resource's client is threadsafe, unlike the table resource
+        client = self.table.meta.client
+        while not segment.complete:
+            response = client.scan(
+                TableName=self.table.name,
+                Segment=segment.segment,
+                TotalSegments=total_segments,
+                **{"Limit": page_size} if page_size else {},
+                **{"ExclusiveStartKey": segment.start_key} if segment.next else {},
+            )
+            records = [
+                schemas.Ingestion.from_dynamodb(item).dynamodb_dict()
+                for item in response["Items"]
+            ]
+            next = response.get("LastEvaluatedKey")
+            segment.exported += len(records)
+            segment.next = schemas.b64_encode_next(next).decode() if next else None
+            segment.complete = next is None
+            yield records
+
+    def export(
+        self,
+        segments: Sequence[schemas.ExportSegment],
+        total_segments: int,
+        write: Callable[[schemas.ExportSegment, List[Dict[str, Any]]], Optional[bool]],
+        deadline: float = float("inf"),
+        page_size: Optional[int] = None,
+        max_workers: int = 8,
+    ) -> Sequence[schemas.ExportSegment]:
+        """
+        Export ingestions by scanning segments of the table in parallel, passing
+        each page of records to `write`. Segments stop once the deadline (in terms
+        of `time.monotonic`) passes, leaving progress from which to resume. `write`
+        may return False to refuse a page (e.g. once a response is full), which
+        stops the segment before the page so that it's exported on resume.
+        """
+
+        def export_segment(segment: schemas.ExportSegment):
+            progress = segment.copy()
+            for records in self.scan_segment(segment, total_segments, page_size):
+                if write(segment, records) is False:
+                    segment.exported = progress.exported
+                    segment.next = progress.next
+                    segment.complete = progress.complete
+                    return
+                if time.monotonic() > deadline:
+                    return
+                progress = segment.copy()
+
+        pending = [s for s in segments if not s.complete]
+        if pending:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(pending))) as ex:
+                list(ex.map(export_segment, pending))
+        return segments
+
+
+class CollectionRefreshes:
+    """
+    Tracks when collections were last loaded into and refreshed, so that their
+    extents and summaries are refreshed at most once per refresh interval.
+    """
+
+    def __init__(self, table: "Table"):
+        self.table = table
+
+    def touch(self, collection_ids: Iterable[str]):
+        """Record that items were loaded into collections"""
+        touched_at = datetime.now().isoformat()
+        for collection_id in collection_ids:
+            self.table.update_item(
+                Key={"collection": collection_id},
+                UpdateExpression="SET touched_at = :touched_at",
+                ExpressionAttributeValues={":touched_at": touched_at},
+            )
+
+    def pending(self) -> List[Tuple[str, str]]:
+        """Collections touched since last refreshed, with when they were touched"""
+        query: Dict[str, Any] = {
+            "FilterExpression": conditions.Attr("refreshed_at").not_exists()
+            | conditions.Attr("refreshed_at").lt(conditions.Attr("touched_at"))
+        }
+        pending = []
+        while True:
+            response = self.table.scan(**query)
+            pending.extend(
+                (item["collection"], item["touched_at"]) for item in response["Items"]
+            )
+            if "LastEvaluatedKey" not in response:
+                return pending
+            query["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def mark_refreshed(self, collection_id: str, touched_at: str):
+        """
+        Record that a collection was refreshed, as of when it was last touched
+        before the refresh, so that it remains pending if touched since.
+        """
+        self.table.update_item(
+            Key={"collection": collection_id},
+            UpdateExpression="SET refreshed_at = :refreshed_at",
+            ExpressionAttributeValues={":refreshed_at": touched_at},
+        )
+
 
 class NotInDb(Exception):  # noqa
     ...
@@ -1,13 +1,31 @@
-from typing import Sequence
+import functools
+import itertools
+import json
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
 import boto3
+import psycopg
 import pydantic
-from fastapi.encoders import jsonable_encoder
+from cachetools import TTLCache, cached
 from pypgstac.db import PgstacDB
 from pypgstac.load import Methods
 
-from .loader import Loader
-from .schemas import Ingestion
+from .loader import Loader, LoadStrategy, PartitionLocked
+from .schemas import Ingestion, Manifest, QueuedIngestion
 
 
 class DbCreds(pydantic.BaseModel):
@@ -23,6 +41,7 @@ class DbCreds(pydantic.BaseModel):
         return f"{self.engine}://{self.username}:{self.password}@{self.host}:{self.port}/{self.dbname}"  # noqa
 
 
+@cached(TTLCache(maxsize=4, ttl=900))
 def get_db_credentials(secret_arn: str) -> DbCreds:
     """
     Load pgSTAC database credentials from AWS Secrets Manager.
@@ -34,19 +53,443 @@ def get_db_credentials(secret_arn: str) -> DbCreds:
     return DbCreds.parse_raw(response["SecretString"])
 
 
-def load_items(creds: DbCreds, ingestions: Sequence[Ingestion]):
+class PgstacConnection:
     """
-    Bulk insert STAC records into pgSTAC.
+    Holds a pgSTAC database connection for reuse across warm Lambda invocations.
     """
-    with PgstacDB(dsn=creds.dsn_string, debug=True) as db:
-        loader = Loader(db=db)
 
-        # serialize to JSON-friendly dicts (won't be necessary in Pydantic v2, https://github.com/pydantic/pydantic/issues/1409#issuecomment-1423995424)
-        items = jsonable_encoder(i.item for i in ingestions)
-        loading_result = loader.load_items(
-            file=items,
-            # use insert_ignore to avoid overwritting existing items or upsert to replace
-            insert_mode=Methods.upsert,
+    def __init__(self):
+        self.db: Optional[PgstacDB] = None
+
+    def get(self, creds: DbCreds) -> PgstacDB:
+        """
+        Return the held connection if it is still healthy, otherwise reconnect.
+        """
+        if self.db is not None and self.db.dsn == creds.dsn_string and self.is_alive():
+            return self.db
+
+        self.close()
+        print("Connecting to pgSTAC...")
+        self.db = PgstacDB(dsn=creds.dsn_string)
+        self.db.connect()
+        return self.db
+
+    def is_alive(self) -> bool:
+        connection = self.db.connection
+        if connection is None or connection.closed:
+            return False
+        try:
+            connection.execute("SELECT 1;")
+            return True
+        except psycopg.Error:
+            return False
+
+    def close(self):
+        if self.db is not None:
+            # disconnect() drops the database's reference to its pool
+            pool = self.db.pool
+            self.db.disconnect()
+            if pool is not None:
+                pool.close()
+        self.db = None
+
+
+pgstac_connection = PgstacConnection()
+
+# Connections for loading items concurrently, the first being `pgstac_connection`
+pgstac_connections = [pgstac_connection]
+
+
+def get_pgstac_connections(count: int) -> List[PgstacConnection]:
+    while len(pgstac_connections) < count:
+        pgstac_connections.append(PgstacConnection())
+    return pgstac_connections[:count]
+
+
+PartitionKey = Tuple[str, str]
+# Load method, collection and partition shared by a group of items
+GroupKey = Tuple[Methods, str, str]
+ItemGroup = List[Tuple[Union[Ingestion, QueuedIngestion], Dict[str, Any]]]
+LoadFailure = Tuple[Union[Ingestion, QueuedIngestion], Exception]
+
+
+def partition_key(loader: Loader, item: Dict[str, Any]) -> PartitionKey:
+    """
+    Collection and name of the pgSTAC partition that an item will be loaded into.
+    Raises if the partition can't be determined, e.g. as the item's collection
+    doesn't exist or the item has no datetime.
+    """
+    collection = item["collection"]
+    _, key, partition_trunc = loader.collection_json(collection)
+    properties = item.get("properties", {})
+    if properties.get("start_datetime") and properties.get("end_datetime"):
+        dt = properties["start_datetime"].replace("-", "")
+    else:
+        dt = properties["datetime"].replace("-", "")
+
+    if partition_trunc == "year":
+        return collection, f"_items_{key}_{dt[:4]}"
+    if partition_trunc == "month":
+        return collection, f"_items_{key}_{dt[:6]}"
+    return collection, f"_items_{key}"
+
+
+def group_items(
+    loader: Loader, ingestions: Sequence[Union[Ingestion, QueuedIngestion]]
+) -> Tuple[Dict[GroupKey, ItemGroup], List[LoadFailure]]:
+    """
+    Group ingestions' items by how they're to be loaded, and by the collection and
+    pgSTAC partition they belong to. Items whose partition can't be determined
+    fail without being loaded, with a single lookup of each missing collection.
+    """
+    groups: Dict[GroupKey, ItemGroup] = {}
+    failures: List[LoadFailure] = []
+    collection_errors: Dict[Any, Exception] = {}
+    for ingestion in ingestions:
+        item = ingestion.item_dict()
+        collection = item.get("collection")
+        if collection in collection_errors:
+            failures.append((ingestion, collection_errors[collection]))
+            continue
+        try:
+            loader.collection_json(collection)
+        except Exception as e:
+            collection_errors[collection] = e
+            failures.append((ingestion, e))
+            continue
+        try:
+            key = (Methods(ingestion.method), *partition_key(loader, item))
+        except Exception as e:
+            failures.append((ingestion, e))
+            continue
+        groups.setdefault(key, []).append((ingestion, item))
+
+    for collection, error in collection_errors.items():
+        print(f"Unable to load items of collection {collection}: {error}")
+    return groups, failures
+
+
+def load_items(
+    creds: DbCreds,
+    ingestions: Sequence[Union[Ingestion, QueuedIngestion]],
+    max_workers: int = 1,
+    lock_timeout: Optional[float] = None,
+    staging_threshold: Optional[int] = None,
+    deadline: float = float("inf"),
+) -> List[LoadFailure]:
+    """
+    Bulk insert STAC records into pgSTAC. Items are loaded in groups sharing a
+    load method, collection and partition, so that each load only locks a single
+    partition
+    and failures are isolated to their group. Groups are shared between up to
+    `max_workers` connections loading concurrently. If `lock_timeout` is set, each
+    group is only loaded once its partition's advisory lock is acquired, waiting up
+    to that many seconds but never past the `deadline` (a `time.monotonic()` time),
+    after which locks are only taken if they're free. Returns the ingestions whose
+    items could not be loaded, alongside the error encountered, which is
+    `PartitionLocked` for groups whose lock couldn't be acquired.
+
+    Groups of at least `staging_threshold` items are loaded through pgSTAC's
+    staging tables, merging them in SQL rather than preparing each in Python.
+    """
+    loader = Loader(db=pgstac_connection.get(creds))
+    groups, unresolved = group_items(loader, ingestions)
+    load = functools.partial(
+        load_group,
+        lock_timeout=lock_timeout,
+        staging_threshold=staging_threshold,
+        deadline=deadline,
+    )
+    workers = min(max_workers, len(groups))
+    if workers <= 1:
+        return unresolved + [
+            failure
+            for key, group in groups.items()
+            for failure in load(loader, key, group)
+        ]
+
+    # Spread groups across workers, largest first, balancing the items each loads
+    lanes: List[List[Tuple[GroupKey, ItemGroup]]] = [[] for _ in range(workers)]
+    for key, group in sorted(groups.items(), key=lambda g: len(g[1]), reverse=True):
+        min(lanes, key=lambda lane: sum(len(g) for _, g in lane)).append((key, group))
+
+    loaders = [loader] + [
+        Loader(db=connection.get(creds))
+        for connection in get_pgstac_connections(workers)[1:]
+    ]
+
+    def load_lane(loader: Loader, lane: List[Tuple[GroupKey, ItemGroup]]):
+        return [failure for key, group in lane for failure in load(loader, key, group)]
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return unresolved + [
+            failure
+            for failures in executor.map(load_lane, loaders, lanes)
+            for failure in failures
+        ]
+
+
+def load_group(
+    loader: Loader,
+    key: GroupKey,
+    group: ItemGroup,
+    lock_timeout: Optional[float] = None,
+    staging_threshold: Optional[int] = None,
+    deadline: float = float("inf"),
+) -> List[LoadFailure]:
+    """
+    Load a group of items sharing a load method and partition, reporting the
+    outcome.
+    """
+    start = time.perf_counter()
+    method, collection, partition = key
+    ingestions, items = zip(*group)
+    load = functools.partial(
+        bisect_load_items,
+        loader,
+        ingestions,
+        items,
+        method=method,
+        staging_threshold=staging_threshold,
+    )
+    if lock_timeout is None:
+        failures = load()
+    else:
+        # Groups are loaded one after another, so bound their total wait
+        timeout = max(0, min(lock_timeout, deadline - time.monotonic()))
+        with loader.partition_lock(collection, partition, timeout) as locked:
+            if not locked:
+                print(
+                    f"Partition {partition} of collection {collection} "
+                    f"is locked, deferring {len(group)} items"
+                )
+                error = PartitionLocked(
+                    f"Partition {partition} of collection {collection} "
+                    "is being loaded by another ingestor"
+                )
+                return [(ingestion, error) for ingestion in ingestions]
+            failures = load()
+    print(
+        f"Loaded ({method.value}) {len(group) - len(failures)} of {len(group)} items "
+        f"of collection {collection} into partition {partition} "
+        f"in {time.perf_counter() - start:.2f}s"
+    )
+    return failures
+
+
+def bisect_load_items(
+    loader: Loader,
+    ingestions: Sequence[Union[Ingestion, QueuedIngestion]],
+    items: Optional[Sequence[Dict[str, Any]]] = None,
+    method: Methods = Methods.upsert,
+    staging_threshold: Optional[int] = None,
+) -> List[LoadFailure]:
+    """
+    Load a batch of items, splitting the batch in half and loading each half
+    separately if it fails so that only the failing items are left unloaded.
+    Connection failures are raised, as they aren't caused by any one item.
+    Batches of at least `staging_threshold` items are loaded through pgSTAC's
+    staging tables.
+    """
+    if items is None:
+        items = [i.item_dict() for i in ingestions]
+    strategy = (
+        LoadStrategy.staging
+        if staging_threshold is not None and len(items) >= staging_threshold
+        else LoadStrategy.partitions
+    )
+    try:
+        loader.load_items(file=list(items), insert_mode=method, strategy=strategy)
+        return []
+    except psycopg.OperationalError:
+        raise
+    except Exception as e:
+        if len(ingestions) == 1:
+            return [(ingestions[0], e)]
+
+        print(f"Failed to load batch of {len(ingestions)} items, bisecting: {e}")
+        middle = len(ingestions) // 2
+        return bisect_load_items(
+            loader,
+            ingestions[:middle],
+            items[:middle],
+            method=method,
+            staging_threshold=staging_threshold,
+        ) + bisect_load_items(
+            loader,
+            ingestions[middle:],
+            items[middle:],
+            method=method,
+            staging_threshold=staging_threshold,
         )
 
-        return loading_result
+
+def emit_metric(namespace: str, name: str, value: float, unit: str, **dimensions: str):
+    """
+    Log a metric in CloudWatch's embedded metric format, from which CloudWatch
+    extracts it.
+    """
+    print(
+        json.dumps(
+            {
+                "_aws": {
+                    "Timestamp": int(time.time() * 1000),
+                    "CloudWatchMetrics": [
+                        {
+                            "Namespace": namespace,
+                            "Dimensions": [list(dimensions)],
+                            "Metrics": [{"Name": name, "Unit": unit}],
+                        }
+                    ],
+                },
+                name: value,
+                **dimensions,
+            }
+        )
+    )
+
+
+async def aiter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Split a stream of bytes into lines.
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+
+def iter_object_ranges(
+    client, bucket: str, key: str, start: int = 0, range_size: int = 8 * 1024**2, **kwargs
+) -> Iterator[bytes]:
+    """
+    Read an S3 object as a series of byte range requests.
+    """
+    size = client.head_object(Bucket=bucket, Key=key, **kwargs)["ContentLength"]
+    for range_start in range(start, size, range_size):
+        range_end = min(range_start + range_size, size) - 1
+        response = client.get_object(
+            Bucket=bucket, Key=key, Range=f"bytes={range_start}-{range_end}", **kwargs
+        )
+        yield response["Body"].read()
+
+
+def iter_gunzip(chunks: Iterator[bytes]) -> Iterator[bytes]:
+    """
+    Decompress a stream of gzipped bytes, supporting concatenated gzip members.
+    """
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            yield decompressor.decompress(chunk)
+            if not decompressor.eof:
+                break
+            chunk = decompressor.unused_data
+            decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+
+
+def iter_lines(chunks: Iterator[bytes], offset: int = 0) -> Iterator[Tuple[int, bytes]]:
+    """
+    Split a stream of bytes into lines, yielding each line along with the offset
+    just past its end.
+    """
+    pending = b""
+    for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            offset += len(line) + 1
+            yield offset, line
+    if pending:
+        yield offset + len(pending), pending
+
+
+class ManifestTimeout(Exception):
+    """The time to load a manifest ran out before reaching its offset"""
+
+
+def skip_lines(
+    lines: Iterator[Tuple[int, bytes]], offset: int, deadline: float
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Skip the lines that end before an offset, raising if the `deadline` (a
+    `time.monotonic()` time) passes while skipping them.
+    """
+    for end, line in lines:
+        if end > offset:
+            yield end, line
+        elif time.monotonic() > deadline:
+            raise ManifestTimeout(f"Timed out skipping to offset {offset}")
+
+
+def iter_manifest_lines(
+    client,
+    manifest: Manifest,
+    range_size: int,
+    deadline: float = float("inf"),
+    **kwargs,
+) -> Iterator[Tuple[int, bytes]]:
+    """
+    Stream the non-empty lines of a manifest that follow its offset. Uncompressed
+    manifests are read starting from the offset, while gzipped manifests must be
+    decompressed from their beginning, until the `deadline` at the latest.
+    """
+    if manifest.compressed:
+        chunks = iter_gunzip(
+            iter_object_ranges(
+                client, manifest.bucket, manifest.key, range_size=range_size, **kwargs
+            )
+        )
+        lines = skip_lines(iter_lines(chunks), manifest.offset, deadline)
+    else:
+        chunks = iter_object_ranges(
+            client,
+            manifest.bucket,
+            manifest.key,
+            start=manifest.offset,
+            range_size=range_size,
+            **kwargs,
+        )
+        lines = iter_lines(chunks, offset=manifest.offset)
+
+    return ((end, line) for end, line in lines if line.strip())
+
+
+def load_manifest(
+    creds: DbCreds,
+    manifest: Manifest,
+    lines: Iterator[Tuple[int, bytes]],
+    chunk_size: int,
+    checkpoint: Callable[[Manifest], bool],
+    method: Methods = Methods.upsert,
+) -> bool:
+    """
+    Load the items of a manifest into pgSTAC in chunks, calling `checkpoint` with
+    the manifest's progress after each chunk is committed. Returns whether the
+    manifest was loaded completely, stopping early if `checkpoint` returns False
+    or the lines time out before reaching the manifest's offset.
+    """
+    loader = Loader(db=pgstac_connection.get(creds))
+
+    try:
+        while chunk := list(itertools.islice(lines, chunk_size)):
+            # Committing a chunk's partitions together lets a failed chunk be
+            # loaded again from the same offset
+            with loader.transaction():
+                loader.load_items(
+                    file=[json.loads(line) for _, line in chunk],
+                    insert_mode=method,
+                )
+            manifest.offset = chunk[-1][0]
+            manifest.items_loaded += len(chunk)
+            if not checkpoint(manifest):
+                return False
+    except ManifestTimeout as e:
+        print(f"Stopped loading {manifest.url}: {e}")
+        return False
+
+    return True
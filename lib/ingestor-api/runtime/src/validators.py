@@ -1,11 +1,28 @@
 import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, Optional, Sequence, Set
+from urllib.parse import urlparse
 
 import boto3
 import requests
+from botocore.config import Config
+from botocore.credentials import RefreshableCredentials
+from botocore.exceptions import BotoCoreError
+from botocore.session import get_session
+from cachetools import TTLCache
+from psycopg_pool import ConnectionPool
+from requests.adapters import HTTPAdapter
 
+_client_lock = threading.Lock()
 
-@functools.cache
-def get_s3_credentials():
+
+def fetch_s3_credentials() -> Dict[str, str]:
+    """
+    Assume the data access role, returning credentials in the metadata format
+    expected by botocore's RefreshableCredentials.
+    """
     from .config import settings
 
     print("Fetching S3 Credentials...")
@@ -15,21 +32,74 @@ def get_s3_credentials():
         RoleSessionName="stac-ingestor-data-validation",
     )
     return {
-        "aws_access_key_id": response["Credentials"]["AccessKeyId"],
-        "aws_secret_access_key": response["Credentials"]["SecretAccessKey"],
-        "aws_session_token": response["Credentials"]["SessionToken"],
+        "access_key": response["Credentials"]["AccessKeyId"],
+        "secret_key": response["Credentials"]["SecretAccessKey"],
+        "token": response["Credentials"]["SessionToken"],
+        "expiry_time": response["Credentials"]["Expiration"].isoformat(),
     }
 
 
+@functools.cache
+def get_s3_credentials() -> RefreshableCredentials:
+    """
+    Return data access role credentials, refreshed by botocore ahead of expiry.
+    """
+    return RefreshableCredentials.create_from_metadata(
+        metadata=fetch_s3_credentials(),
+        refresh_using=fetch_s3_credentials,
+        method="sts-assume-role",
+    )
+
+
+@functools.cache
+def get_s3_client():
+    """
+    Return an S3 client using the data access role, reused across validations
+    so that warm Lambdas keep their connection pool.
+    """
+    from .config import settings
+
+    botocore_session = get_session()
+    botocore_session._credentials = get_s3_credentials()
+
+    # boto3's sessions aren't threadsafe when creating clients
+    with _client_lock:
+        return boto3.Session(botocore_session=botocore_session).client(
+            "s3",
+            config=Config(
+                max_pool_connections=settings.asset_validation_concurrency,
+                connect_timeout=settings.asset_validation_connect_timeout,
+                read_timeout=settings.asset_validation_read_timeout,
+            ),
+        )
+
+
+@functools.cache
+def get_http_session() -> requests.Session:
+    """
+    Return a keep-alive HTTP session, reused across validations.
+    """
+    from .config import settings
+
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=settings.asset_validation_concurrency,
+        pool_maxsize=settings.asset_validation_concurrency,
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
 def s3_object_is_accessible(bucket: str, key: str):
     """
-    Ensure we can send HEAD requests to S3 objects.
+    Ensure we can send HEAD requests to S3 objects, returning the response.
     """
     from .config import settings
 
-    client = boto3.client("s3", **get_s3_credentials())
+    client = get_s3_client()
     try:
-        client.head_object(
+        return client.head_object(
             Bucket=bucket,
             Key=key,
             **{"RequestPayer": "requester"} if settings.requester_pays else {},
@@ -38,35 +108,304 @@ def s3_object_is_accessible(bucket: str, key: str):
         raise ValueError(
             f"Asset not accessible: {e.__dict__['response']['Error']['Message']}"
         ) from e
+    except BotoCoreError as e:
+        # e.g. the endpoint couldn't be reached
+        raise ValueError(f"Asset not accessible: {e}") from e
+
+
+def manifest_is_accessible(bucket: str, key: str):
+    """
+    Ensure a manifest is accessible and, if gzipped, small enough to decompress up
+    to where a resumed load left off within the ingestor's timeout.
+    """
+    from .config import settings
+
+    head = s3_object_is_accessible(bucket=bucket, key=key)
+    if (
+        key.endswith(".gz")
+        and head["ContentLength"] > settings.manifest_max_compressed_size
+    ):
+        raise ValueError(
+            f"Gzipped manifest is larger than {settings.manifest_max_compressed_size} "
+            "bytes, split it or upload it uncompressed"
+        )
 
 
 def url_is_accessible(href: str):
     """
     Ensure URLs are accessible via HEAD requests.
     """
+    from .config import settings
+
     try:
-        requests.head(href).raise_for_status()
+        get_http_session().head(
+            href,
+            timeout=(
+                settings.asset_validation_connect_timeout,
+                settings.asset_validation_read_timeout,
+            ),
+        ).raise_for_status()
     except requests.exceptions.HTTPError as e:
         raise ValueError(
             f"Asset not accessible: {e.response.status_code} {e.response.reason}"
         ) from e
+    except requests.exceptions.RequestException as e:
+        # e.g. the host couldn't be resolved, refused the connection or timed out
+        raise ValueError(f"Asset not accessible: {e}") from e
 
 
-@functools.cache
-def collection_exists(collection_id: str) -> bool:
+def asset_is_accessible(href: str):
     """
-    Ensure collection exists in STAC
+    Ensure an asset is accessible, dispatching on the scheme of its href.
+    """
+    url = urlparse(href)
+
+    if url.scheme in ["https", "http"]:
+        url_is_accessible(href=href)
+    elif url.scheme in ["s3"]:
+        s3_object_is_accessible(bucket=url.hostname, key=url.path.lstrip("/"))
+    else:
+        raise ValueError(f"Unsupported scheme: {url.scheme}")
+
+
+def assets_are_accessible(
+    hrefs: Dict[str, str], max_workers: Optional[int] = None
+) -> Dict[str, ValueError]:
     """
+    Concurrently ensure assets are accessible. Returns the errors encountered,
+    keyed by asset name.
+    """
+    from .config import settings
+
+    if not hrefs:
+        return {}
+
+    def check(href: str) -> Optional[ValueError]:
+        try:
+            asset_is_accessible(href=href)
+        except ValueError as e:
+            return e
+
+    max_workers = max_workers or settings.asset_validation_concurrency
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(hrefs))) as executor:
+        results = dict(zip(hrefs, executor.map(check, hrefs.values())))
+
+    return {name: error for name, error in results.items() if error}
+
+
+class CollectionCache:
+    """
+    Bounded cache of collection lookups, remembering collections that exist and
+    collections that don't for separate periods of time.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, negative_ttl: int):
+        self.found = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.missing = TTLCache(maxsize=maxsize, ttl=negative_ttl)
+        self.prefilled = False
+        self._lock = threading.Lock()
+
+    def add_found(self, collection_id: str):
+        with self._lock:
+            self.missing.pop(collection_id, None)
+            self.found[collection_id] = True
+
+    def add_missing(self, collection_id: str, message: str):
+        with self._lock:
+            self.found.pop(collection_id, None)
+            self.missing[collection_id] = message
+
+    def is_found(self, collection_id: str) -> bool:
+        with self._lock:
+            return self.found.get(collection_id, False)
+
+    def get_missing(self, collection_id: str) -> Optional[str]:
+        with self._lock:
+            return self.missing.get(collection_id)
+
+    def invalidate(self, collection_id: str):
+        with self._lock:
+            self.found.pop(collection_id, None)
+            self.missing.pop(collection_id, None)
+
+
+@functools.cache
+def get_collection_cache() -> CollectionCache:
     from .config import settings
 
-    url = "/".join(
-        f'{url.strip("/")}' for url in [settings.stac_url, "collections", collection_id]
+    return CollectionCache(
+        maxsize=settings.collection_cache_maxsize,
+        ttl=settings.collection_cache_ttl,
+        negative_ttl=settings.collection_cache_negative_ttl,
     )
 
-    if (response := requests.get(url)).ok:
-        return True
 
-    raise ValueError(
-        f"Invalid collection '{collection_id}', received "
-        f"{response.status_code} response code from STAC API"
+def invalidate_collection(collection_id: str):
+    """
+    Forget any cached lookup of a collection, e.g. after it was created or deleted.
+    """
+    get_collection_cache().invalidate(collection_id)
+
+
+def prefill_collection_cache() -> int:
+    """
+    Populate the collection cache from a single listing of the STAC API's
+    collections. Returns the number of collections cached.
+    """
+    from .config import settings
+
+    cache = get_collection_cache()
+    cache.prefilled = True
+
+    url = "/".join(f'{url.strip("/")}' for url in [settings.stac_url, "collections"])
+    try:
+        response = get_http_session().get(
+            url,
+            timeout=(
+                settings.asset_validation_connect_timeout,
+                settings.asset_validation_read_timeout,
+            ),
+        )
+        response.raise_for_status()
+        collections = response.json()["collections"]
+    except (requests.exceptions.RequestException, ValueError, KeyError) as e:
+        print(f"Unable to prefill collection cache: {e}")
+        return 0
+
+    for collection in collections:
+        cache.add_found(collection["id"])
+    return len(collections)
+
+
+@functools.cache
+def get_db_pool() -> ConnectionPool:
+    """
+    Return a pool of connections to pgSTAC, reused across validations.
+    """
+    from .config import settings
+    from .utils import get_db_credentials
+
+    creds = get_db_credentials(os.environ["DB_SECRET_ARN"])
+    return ConnectionPool(
+        conninfo=creds.dsn_string,
+        min_size=1,
+        max_size=settings.db_pool_max_size,
+        timeout=settings.db_pool_timeout,
+        kwargs={"connect_timeout": settings.db_pool_timeout},
+        # psycopg_pool is moving to not opening pools by default
+        open=True,
     )
+
+
+def pgstac_collection_ids(collection_ids: Sequence[str]) -> Set[str]:
+    """
+    Return which of the provided collection ids exist in pgSTAC, in a single query.
+    """
+    with get_db_pool().connection() as conn:
+        rows = conn.execute(
+            "SELECT id FROM pgstac.collections WHERE id = ANY(%s);",
+            [list(collection_ids)],
+        ).fetchall()
+    return {row[0] for row in rows}
+
+
+def check_collections_in_pgstac(collection_ids: Sequence[str]) -> Dict[str, str]:
+    cache = get_collection_cache()
+    found = pgstac_collection_ids(collection_ids)
+
+    errors = {}
+    for collection_id in collection_ids:
+        if collection_id in found:
+            cache.add_found(collection_id)
+            continue
+
+        errors[collection_id] = (
+            f"Invalid collection '{collection_id}', not found in pgSTAC"
+        )
+        cache.add_missing(collection_id, errors[collection_id])
+    return errors
+
+
+def check_collections_in_stac_api(collection_ids: Sequence[str]) -> Dict[str, str]:
+    from .config import settings
+
+    cache = get_collection_cache()
+    if not cache.prefilled:
+        prefill_collection_cache()
+
+    errors = {}
+    for collection_id in collection_ids:
+        if cache.is_found(collection_id):
+            continue
+
+        url = "/".join(
+            f'{url.strip("/")}'
+            for url in [settings.stac_url, "collections", collection_id]
+        )
+        try:
+            response = get_http_session().get(
+                url,
+                timeout=(
+                    settings.asset_validation_connect_timeout,
+                    settings.asset_validation_read_timeout,
+                ),
+            )
+        except requests.exceptions.RequestException as e:
+            # Not cached, as the STAC API may be reachable again for the next request
+            errors[collection_id] = (
+                f"Unable to check collection '{collection_id}' in STAC API: {e}"
+            )
+            continue
+        if response.ok:
+            cache.add_found(collection_id)
+            continue
+
+        errors[collection_id] = (
+            f"Invalid collection '{collection_id}', received "
+            f"{response.status_code} response code from STAC API"
+        )
+        if response.status_code == 404:
+            cache.add_missing(collection_id, errors[collection_id])
+    return errors
+
+
+def check_collections(collection_ids: Iterable[str]) -> Dict[str, str]:
+    """
+    Ensure collections exist, looking up any that aren't cached in a single batch.
+    Returns the errors encountered, keyed by collection id.
+    """
+    from .config import settings
+
+    cache = get_collection_cache()
+
+    errors = {}
+    unknown = []
+    for collection_id in dict.fromkeys(collection_ids):
+        if cache.is_found(collection_id):
+            continue
+        if message := cache.get_missing(collection_id):
+            errors[collection_id] = message
+            continue
+        unknown.append(collection_id)
+
+    if not unknown:
+        return errors
+
+    if settings.collection_lookup == "pgstac":
+        try:
+            errors.update(check_collections_in_pgstac(unknown))
+            return errors
+        except Exception as e:
+            print(f"Unable to check collections in pgSTAC, using STAC API: {e}")
+
+    errors.update(check_collections_in_stac_api(unknown))
+    return errors
+
+
+def collection_exists(collection_id: str) -> bool:
+    """
+    Ensure collection exists in STAC
+    """
+    if errors := check_collections([collection_id]):
+        raise ValueError(errors[collection_id])
+    return True
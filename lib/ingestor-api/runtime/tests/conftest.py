@@ -77,6 +77,17 @@ def mock_table(app, test_environ):
         app.dependency_overrides.pop(dependencies.get_table)
 
 
+@pytest.fixture
+def mock_refresh_table(mock_table):
+    client = boto3.resource("dynamodb")
+    yield client.create_table(
+        TableName="test_refresh_table",
+        AttributeDefinitions=[{"AttributeName": "collection", "AttributeType": "S"}],
+        KeySchema=[{"AttributeName": "collection", "KeyType": "HASH"}],
+        BillingMode="PAY_PER_REQUEST",
+    )
+
+
 @pytest.fixture
 def example_stac_item():
     return {
@@ -249,7 +260,8 @@ def client_authenticated(app):
     from src.dependencies import get_username
 
     app.dependency_overrides[get_username] = lambda: "test_user"
-    return TestClient(app)
+    yield TestClient(app)
+    app.dependency_overrides.pop(get_username, None)
 
 
 @pytest.fixture
@@ -14,7 +14,7 @@ def test_auth_publish_collection(
         headers={"Authorization": f"bearer {token}"},
         json=example_stac_collection,
     )
-    ingest.assert_called_once_with(stac_collection)
+    ingest.assert_called_once_with(stac_collection, method="upsert")
     assert response.status_code == 201
 
 
@@ -39,3 +39,27 @@ def test_unauth_delete_collection(client, example_stac_collection):
         delete_collection_endpoint.format(collection_id=example_stac_collection["id"]),
     )
     assert response.status_code == 403
+
+
+@patch("src.collection.ingest")
+def test_publish_collection_with_method(
+    ingest, stac_collection, example_stac_collection, client_authenticated, monkeypatch
+):
+    from src.config import settings
+
+    response = client_authenticated.post(
+        publish_collections_endpoint,
+        params={"method": "ignore"},
+        json=example_stac_collection,
+    )
+    ingest.assert_called_once_with(stac_collection, method="ignore")
+    assert response.status_code == 201
+
+    # collections can't be delserted, even if permitted for items
+    monkeypatch.setattr(settings, "load_methods", ["upsert", "delsert"])
+    response = client_authenticated.post(
+        publish_collections_endpoint,
+        params={"method": "delsert"},
+        json=example_stac_collection,
+    )
+    assert response.status_code == 422
@@ -1,4 +1,4 @@
-from unittest.mock import patch
+from unittest.mock import Mock, patch
 
 import pytest
 
@@ -26,7 +26,7 @@ def get_db_credentials():
 
 @pytest.fixture()
 def load_items():
-    with patch("src.ingestor.load_items", return_value=0, autospec=True) as m:
+    with patch("src.ingestor.load_items", return_value=[], autospec=True) as m:
         yield m
 
 
@@ -49,12 +49,251 @@ def test_handler(
 ):
     import src.ingestor as ingestor
 
+    mock_table.put_item(Item=example_ingestion.dynamodb_dict())
     ingestor.handler(dynamodb_stream_event, {})
     load_items.assert_called_once_with(
         creds="",
         ingestions=[example_ingestion],
+        max_workers=1,
+        lock_timeout=10,
+        staging_threshold=None,
+        deadline=float("inf"),
     )
     response = mock_table.get_item(
         Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
     )
     assert response["Item"]["status"] == "succeeded"
+
+
+def test_handler_records_touched_collections(
+    test_environ,
+    dynamodb_stream_event,
+    example_ingestion,
+    get_queued_ingestions,
+    get_db_credentials,
+    load_items,
+    get_table,
+    mock_table,
+    mock_refresh_table,
+):
+    import src.ingestor as ingestor
+    from src import services
+    from src.loader import Loader
+
+    mock_table.put_item(Item=example_ingestion.dynamodb_dict())
+    with patch.object(
+        ingestor.settings, "collection_refresh_table", "test_refresh_table"
+    ), patch.object(Loader, "touched_collections", {"simple-collection"}):
+        ingestor.handler(dynamodb_stream_event, {})
+
+    pending = services.CollectionRefreshes(mock_refresh_table).pending()
+    assert [collection for collection, _ in pending] == ["simple-collection"]
+
+
+@pytest.fixture()
+def manifest_ingestion():
+    from src import schemas
+
+    return schemas.Ingestion(
+        id="manifest",
+        created_by="test-user",
+        status=schemas.Status.queued,
+        manifest=schemas.Manifest(url="s3://bucket/items.ndjson"),
+    )
+
+
+@pytest.mark.parametrize(
+    "remaining_seconds,expected_status", [(180, "succeeded"), (10, "queued")]
+)
+def test_handler_manifest(
+    monkeypatch,
+    test_environ,
+    manifest_ingestion,
+    get_db_credentials,
+    get_table,
+    mock_table,
+    remaining_seconds,
+    expected_status,
+):
+    import src.ingestor as ingestor
+
+    mock_table.put_item(Item=manifest_ingestion.dynamodb_dict())
+
+    def load_manifest(manifest, checkpoint, **kwargs):
+        manifest.offset = 100
+        manifest.items_loaded = 10
+        return checkpoint(manifest)
+
+    context = Mock(get_remaining_time_in_millis=lambda: remaining_seconds * 1000)
+    with patch(
+        "src.ingestor.get_queued_ingestions", return_value=iter([manifest_ingestion])
+    ), patch("src.ingestor.get_s3_client"), patch(
+        "src.ingestor.iter_manifest_lines"
+    ), patch("src.ingestor.load_manifest", side_effect=load_manifest):
+        ingestor.handler({"Records": None}, context)
+
+    response = mock_table.get_item(
+        Key={"created_by": manifest_ingestion.created_by, "id": manifest_ingestion.id}
+    )
+    assert response["Item"]["status"] == expected_status
+    assert response["Item"]["manifest"]["offset"] == 100
+    assert response["Item"]["manifest"]["items_loaded"] == 10
+
+
+def stream_record(ingestion, sequence_number="1"):
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    return {
+        "dynamodb": {
+            "NewImage": {
+                k: serializer.serialize(v) for k, v in ingestion.dynamodb_dict().items()
+            },
+            "SequenceNumber": sequence_number,
+        }
+    }
+
+
+def test_handler_isolates_failures(
+    test_environ, example_ingestion, get_db_credentials, get_table, mock_table
+):
+    import src.ingestor as ingestor
+
+    bad_ingestion = example_ingestion.copy(update={"id": "bad"})
+    for ingestion in [example_ingestion, bad_ingestion]:
+        mock_table.put_item(Item=ingestion.dynamodb_dict())
+    records = [
+        stream_record(example_ingestion, "1"),
+        stream_record(bad_ingestion, "2"),
+    ]
+
+    def load_items(creds, ingestions, **kwargs):
+        return [(i, Exception("MOCKED LOAD ERROR")) for i in ingestions if i.id == "bad"]
+
+    with patch("src.ingestor.load_items", side_effect=load_items):
+        response = ingestor.handler({"Records": records}, {})
+
+    assert response == {"batchItemFailures": []}
+    statuses = {
+        i.id: mock_table.get_item(Key={"created_by": i.created_by, "id": i.id})["Item"]
+        for i in [example_ingestion, bad_ingestion]
+    }
+    assert statuses[example_ingestion.id]["status"] == "succeeded"
+    assert statuses["bad"]["status"] == "failed"
+    assert statuses["bad"]["message"] == "MOCKED LOAD ERROR"
+    get_table.assert_called_once()
+
+
+def test_handler_requeues_locked_partitions(
+    test_environ, example_ingestion, get_db_credentials, get_table, mock_table
+):
+    import src.ingestor as ingestor
+    from src.loader import PartitionLocked
+
+    mock_table.put_item(Item=example_ingestion.dynamodb_dict())
+    records = [stream_record(example_ingestion, "1")]
+
+    def load_items(creds, ingestions, **kwargs):
+        return [(i, PartitionLocked("MOCKED LOCKED")) for i in ingestions]
+
+    with patch("src.ingestor.load_items", side_effect=load_items):
+        response = ingestor.handler({"Records": records}, {})
+
+    assert response == {"batchItemFailures": []}
+    stored = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )["Item"]
+    assert stored["status"] == "queued"
+    assert stored["message"].startswith("Waiting for another ingestor")
+
+
+def test_handler_retries_batch_failures(
+    test_environ, example_ingestion, get_db_credentials, get_table, mock_table
+):
+    import src.ingestor as ingestor
+
+    records = [stream_record(example_ingestion, "1")]
+    with patch("src.ingestor.load_items", side_effect=Exception("MOCKED DB ERROR")):
+        response = ingestor.handler({"Records": records}, {})
+
+    assert response == {"batchItemFailures": [{"itemIdentifier": "1"}]}
+
+
+def test_handler_fetches_staged_items(
+    test_environ, example_ingestion, get_db_credentials, load_items, get_table, mock_table
+):
+    import src.ingestor as ingestor
+    from src import services
+
+    mock_table.put_item(Item=example_ingestion.dynamodb_dict())
+    record = stream_record(example_ingestion)
+    del record["dynamodb"]["NewImage"]["item"]
+    record["dynamodb"]["NewImage"]["item_url"] = {"S": "s3://bucket/item.json.gz"}
+    item_store = Mock(spec=services.ItemStore)
+    item_store.get_many.return_value = [example_ingestion.item_json()]
+
+    with patch("src.ingestor.get_item_store", return_value=item_store):
+        ingestor.handler({"Records": [record]}, {})
+
+    item_store.get_many.assert_called_once_with(
+        ["s3://bucket/item.json.gz"], max_workers=16
+    )
+    (ingestion,) = load_items.call_args.kwargs["ingestions"]
+    assert ingestion.item_dict() == example_ingestion.item_dict()
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_get_queued_ingestions_compressed(
+    test_environ, mock_ssm_parameter_store, example_ingestion, compression
+):
+    import base64
+
+    from src import ingestor
+
+    record = stream_record(example_ingestion)
+    item = example_ingestion.dynamodb_dict(compression=compression)["item"]
+    record["dynamodb"]["NewImage"]["item"] = {"B": base64.b64encode(item).decode()}
+
+    (ingestion,) = ingestor.get_queued_ingestions([record])
+
+    assert ingestion.item_dict() == example_ingestion.item_dict()
+
+
+def test_handler_skips_cancelled(
+    test_environ, example_ingestion, get_db_credentials, load_items, get_table, mock_table
+):
+    import src.ingestor as ingestor
+
+    # cancelled by the user after being queued
+    records = [stream_record(example_ingestion)]
+    mock_table.put_item(
+        Item=example_ingestion.copy(update={"status": "cancelled"}).dynamodb_dict()
+    )
+
+    ingestor.handler({"Records": records}, {})
+
+    response = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )
+    assert response["Item"]["status"] == "cancelled"
+
+
+def test_get_queued_ingestions(test_environ, mock_ssm_parameter_store, example_ingestion):
+    from fastapi.encoders import jsonable_encoder
+    from src import ingestor
+
+    records = [
+        stream_record(example_ingestion.copy(update={"status": status}), str(n))
+        for n, status in enumerate(["succeeded", "queued", "failed"])
+    ]
+    # records that aren't queued shouldn't be decoded any further
+    records[0]["dynamodb"]["NewImage"]["item"] = {"S": "not json"}
+    records.append({"eventName": "REMOVE", "dynamodb": {"SequenceNumber": "3"}})
+
+    ingestions = list(ingestor.get_queued_ingestions(records))
+
+    assert len(ingestions) == 1
+    assert ingestions[0].sequence_number == "1"
+    assert ingestions[0].id == example_ingestion.id
+    assert isinstance(ingestions[0].item, str)
+    assert ingestions[0].item_dict() == jsonable_encoder(example_ingestion.item)
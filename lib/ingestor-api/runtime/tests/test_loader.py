@@ -0,0 +1,193 @@
+"""
+Loads items into a disposable pgSTAC database, given its connection string in
+PGSTAC_TEST_DSN; skipped otherwise.
+"""
+
+import os
+import uuid
+from datetime import datetime, timezone
+
+import pytest
+from psycopg.types.json import Jsonb
+from pypgstac.db import PgstacDB
+from pypgstac.load import Methods
+from src.loader import STAGING_TABLES, Loader
+
+DSN = os.environ.get("PGSTAC_TEST_DSN")
+
+pytestmark = pytest.mark.skipif(not DSN, reason="PGSTAC_TEST_DSN is not set")
+
+
+@pytest.fixture
+def loader():
+    loader = Loader(db=PgstacDB(dsn=DSN))
+    yield loader
+    loader.db.close()
+
+
+@pytest.fixture
+def collection_id(loader):
+    collection_id = f"test-loader-{uuid.uuid4().hex[:8]}"
+    loader.load_collections(
+        file=[
+            {
+                "type": "Collection",
+                "stac_version": "1.0.0",
+                "id": collection_id,
+                "description": "Items loaded by the ingestor's tests",
+                "license": "proprietary",
+                "links": [],
+                "extent": {
+                    "spatial": {"bbox": [[-180, -90, 180, 90]]},
+                    "temporal": {"interval": [[None, None]]},
+                },
+            }
+        ],
+        insert_mode=Methods.insert,
+    )
+    yield collection_id
+    with loader.conn.cursor() as cur:
+        cur.execute("SELECT pgstac.delete_collection(%s);", [collection_id])
+
+
+def make_item(collection_id, item_id, day, **properties):
+    return {
+        "type": "Feature",
+        "stac_version": "1.0.0",
+        "stac_extensions": [],
+        "id": item_id,
+        "collection": collection_id,
+        "geometry": {
+            "type": "Polygon",
+            "coordinates": [[[0, 0], [1, 0], [1, 1], [0, 1], [0, 0]]],
+        },
+        "bbox": [0, 0, 1, 1],
+        "properties": {"datetime": f"2020-01-{day:02d}T00:00:00Z", **properties},
+        "links": [],
+        "assets": {"data": {"href": f"s3://test/{item_id}.tif"}},
+    }
+
+
+def loaded_items(loader, collection_id):
+    with loader.conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, datetime FROM pgstac.items WHERE collection = %s ORDER BY id;",
+            [collection_id],
+        )
+        return cur.fetchall()
+
+
+def staged_rows(loader, insert_mode):
+    with loader.conn.cursor() as cur:
+        cur.execute(f"SELECT count(*) FROM pgstac.{STAGING_TABLES[insert_mode]};")
+        return cur.fetchone()[0]
+
+
+@pytest.mark.parametrize("insert_mode", [Methods.insert, Methods.ignore, Methods.upsert])
+def test_load_items_staged(loader, collection_id, insert_mode):
+    items = [make_item(collection_id, f"item-{i}", i + 1) for i in range(3)]
+
+    loader.load_items_staged(items, insert_mode)
+
+    assert [item_id for item_id, _ in loaded_items(loader, collection_id)] == [
+        "item-0",
+        "item-1",
+        "item-2",
+    ]
+    assert staged_rows(loader, insert_mode) == 0
+    assert collection_id in Loader.take_touched_collections()
+
+
+def test_load_items_staged_upserts(loader, collection_id):
+    loader.load_items_staged([make_item(collection_id, "item", 1)], Methods.insert)
+
+    loader.load_items_staged([make_item(collection_id, "item", 2)], Methods.upsert)
+
+    (item,) = loaded_items(loader, collection_id)
+    assert item[1] == datetime(2020, 1, 2, tzinfo=timezone.utc)
+
+
+def test_load_items_staged_updates_partition_stats(loader, collection_id):
+    loader.load_items_staged([make_item(collection_id, "item-0", 1)], Methods.insert)
+
+    loader.load_items_staged([make_item(collection_id, "item-1", 5)], Methods.insert)
+
+    with loader.conn.cursor() as cur:
+        cur.execute(
+            "SELECT max(upper(dtrange)) FROM pgstac.partitions_view "
+            "WHERE collection = %s;",
+            [collection_id],
+        )
+        assert cur.fetchone()[0] == datetime(2020, 1, 5, tzinfo=timezone.utc)
+
+
+def set_summaries(loader, collection_id, summaries):
+    with loader.conn.cursor() as cur:
+        cur.execute(
+            "UPDATE pgstac.collections SET content = jsonb_set(content, '{summaries}', %s) "
+            "WHERE id = %s;",
+            [Jsonb(summaries), collection_id],
+        )
+
+
+def collection_content(loader, collection_id):
+    with loader.conn.cursor() as cur:
+        cur.execute(
+            "SELECT content FROM pgstac.collections WHERE id = %s;", [collection_id]
+        )
+        return cur.fetchone()[0]
+
+
+def test_update_collection_summaries_extent(loader, collection_id):
+    loader.load_items_staged(
+        [make_item(collection_id, f"item-{day}", day) for day in (3, 7)],
+        Methods.insert,
+    )
+    # pgSTAC estimates spatial extents from the planner's statistics
+    with loader.conn.cursor() as cur:
+        cur.execute("ANALYZE pgstac.items;")
+
+    loader.update_collection_summaries(collection_id)
+
+    extent = collection_content(loader, collection_id)["extent"]
+    (interval,) = extent["temporal"]["interval"]
+    assert [datetime.fromisoformat(dt) for dt in interval] == [
+        datetime(2020, 1, 3, tzinfo=timezone.utc),
+        datetime(2020, 1, 7, tzinfo=timezone.utc),
+    ]
+    assert extent["spatial"]["bbox"][0] == pytest.approx([0, 0, 1, 1], abs=0.01)
+
+
+def test_update_collection_summaries_range(loader, collection_id):
+    set_summaries(
+        loader, collection_id, {"eo:cloud_cover": {"minimum": 0, "maximum": 100}}
+    )
+    loader.load_items_staged(
+        [
+            make_item(collection_id, f"item-{cover}", 1, **{"eo:cloud_cover": cover})
+            for cover in (40, 10, 25)
+        ],
+        Methods.insert,
+    )
+
+    loader.update_collection_summaries(collection_id)
+
+    assert collection_content(loader, collection_id)["summaries"] == {
+        "eo:cloud_cover": {"minimum": 10, "maximum": 40}
+    }
+
+
+def test_update_collection_summaries_values(loader, collection_id):
+    set_summaries(loader, collection_id, {"platform": ["old"]})
+    loader.load_items_staged(
+        [
+            make_item(collection_id, f"item-{i}", 1, platform=platform)
+            for i, platform in enumerate(["b", "a", "b"])
+        ],
+        Methods.insert,
+    )
+
+    loader.update_collection_summaries(collection_id)
+
+    summaries = collection_content(loader, collection_id)["summaries"]
+    assert sorted(summaries["platform"]) == ["a", "b"]
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.fixture()
+def loader():
+    with patch("src.refresher.Loader", autospec=True) as m:
+        yield m
+
+
+@pytest.fixture()
+def refreshes(test_environ, mock_refresh_table):
+    from src import services
+
+    with patch(
+        "src.refresher.get_collection_refresh_table",
+        return_value=mock_refresh_table,
+    ), patch("src.refresher.get_db_credentials", return_value=""), patch(
+        "src.refresher.pgstac_connection"
+    ):
+        yield services.CollectionRefreshes(mock_refresh_table)
+
+
+def test_handler_refreshes_pending_collections(loader, refreshes, capsys):
+    import src.refresher as refresher
+
+    refreshes.touch(["a", "b"])
+    loader.return_value.update_collection_summaries.side_effect = [
+        None,
+        Exception("oops"),
+    ]
+    refresher.handler({}, {})
+
+    assert loader.return_value.update_collection_summaries.call_count == 2
+    assert [collection for collection, _ in refreshes.pending()] == ["b"]
+    assert '"CollectionRefreshDuration"' in capsys.readouterr().out
+
+
+def test_handler_without_pending_collections(loader, refreshes):
+    import src.refresher as refresher
+
+    refresher.handler({}, {})
+    loader.assert_not_called()
@@ -2,7 +2,7 @@ import base64
 import json
 from datetime import timedelta
 from typing import TYPE_CHECKING, List
-from unittest.mock import call, patch
+from unittest.mock import Mock, call, patch
 
 import pytest
 from fastapi.encoders import jsonable_encoder
@@ -12,6 +12,10 @@ if TYPE_CHECKING:
     from src import schemas, services
 
 ingestion_endpoint = "/ingestions"
+bulk_endpoint = "/ingestions/bulk"
+manifest_endpoint = "/ingestions/manifests"
+user_ingestion_endpoint = "/users/me/ingestions"
+export_endpoint = "/ingestions/export"
 
 
 @pytest.fixture()
@@ -80,6 +84,31 @@ class TestCreate:
         assert len(stored_data) == 1
         assert json.loads(stored_data[0].json(by_alias=True)) == response.json()
 
+    def test_create_with_method(
+        self, client_authenticated, collection_exists, asset_exists
+    ):
+        response = self.api_client.post(
+            ingestion_endpoint,
+            params={"method": "insert"},
+            json=jsonable_encoder(self.example_ingestion.item),
+        )
+
+        assert response.status_code == 201
+        (stored,) = self.db.fetch_many(status="queued")["items"]
+        assert stored.method == "insert"
+
+    def test_rejects_disallowed_method(
+        self, client_authenticated, collection_exists, asset_exists
+    ):
+        response = self.api_client.post(
+            ingestion_endpoint,
+            params={"method": "delsert"},
+            json=jsonable_encoder(self.example_ingestion.item),
+        )
+
+        assert response.status_code == 422
+        assert response.json()["detail"][0]["loc"] == ["query", "method"]
+
     def test_validates_missing_collection(
         self, client_authenticated, collection_missing, asset_exists
     ):
@@ -125,6 +154,229 @@ class TestCreate:
         ), "data should not be stored in DB"
 
 
+class TestBulkCreate:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        api_client: "TestClient",
+        mock_table: "services.Table",
+        example_ingestion: "schemas.Ingestion",
+    ):
+        from src import services
+
+        self.api_client = api_client
+        self.mock_table = mock_table
+        self.db = services.Database(self.mock_table)
+        self.example_ingestion = example_ingestion
+
+    @pytest.fixture(autouse=True)
+    def check_collections(self):
+        with patch("src.validators.check_collections", return_value={}) as m:
+            yield m
+
+    def example_items(self, count=3):
+        items = []
+        for i in range(count):
+            item = jsonable_encoder(self.example_ingestion.item)
+            item["id"] = str(i)
+            items.append(item)
+        return items
+
+    def test_unauthenticated_bulk_create(self, app, monkeypatch):
+        from src.dependencies import get_username
+
+        monkeypatch.delitem(app.dependency_overrides, get_username, raising=False)
+        response = self.api_client.post(bulk_endpoint, json=self.example_items())
+
+        assert response.status_code == 403
+
+    def test_bulk_create(self, client_authenticated, collection_exists, asset_exists):
+        items = self.example_items()
+        response = self.api_client.post(bulk_endpoint, json=items)
+
+        assert response.status_code == 200
+        assert response.json() == {
+            "items": [{"id": item["id"], "status": "queued"} for item in items]
+        }
+        stored_data = self.db.fetch_many(status="queued")["items"]
+        assert sorted(ingestion.id for ingestion in stored_data) == ["0", "1", "2"]
+
+    def test_bulk_create_item_collection(
+        self, client_authenticated, collection_exists, asset_exists
+    ):
+        response = self.api_client.post(
+            bulk_endpoint,
+            json={"type": "FeatureCollection", "features": self.example_items()},
+        )
+
+        assert response.status_code == 200
+        assert len(self.db.fetch_many(status="queued")["items"]) == 3
+
+    def test_bulk_create_partial_failure(
+        self, client_authenticated, collection_exists, asset_exists
+    ):
+        items = self.example_items()
+        del items[1]["geometry"]
+
+        response = self.api_client.post(bulk_endpoint, json=items)
+
+        assert response.status_code == 200
+        results = response.json()["items"]
+        assert [result["status"] for result in results] == [
+            "queued",
+            "failed",
+            "queued",
+        ]
+        assert results[1]["id"] == "1"
+        assert any(err["loc"] == ["geometry"] for err in results[1]["errors"])
+        stored_data = self.db.fetch_many(status="queued")["items"]
+        assert sorted(ingestion.id for ingestion in stored_data) == ["0", "2"]
+
+    def test_bulk_create_unreachable_asset(self, client_authenticated, collection_exists):
+        import requests
+
+        items = self.example_items(2)
+        for asset in items[1]["assets"].values():
+            asset["href"] = asset["href"].replace("TEST_API.com", "unreachable.com")
+
+        def head(href, **kwargs):
+            if "unreachable" in href:
+                raise requests.exceptions.ConnectionError("MOCKED CONNECTION REFUSED")
+            return Mock()
+
+        with patch("src.validators.get_http_session") as get_http_session:
+            get_http_session.return_value.head.side_effect = head
+            response = self.api_client.post(bulk_endpoint, json=items)
+
+        assert response.status_code == 200
+        results = response.json()["items"]
+        assert [result["status"] for result in results] == ["queued", "failed"]
+        assert "MOCKED CONNECTION REFUSED" in results[1]["errors"][0]["msg"]
+
+    def test_bulk_create_unreachable_stac_api(
+        self, client_authenticated, check_collections, asset_exists
+    ):
+        items = self.example_items(2)
+        collection_id = items[0]["collection"]
+        check_collections.return_value = {
+            collection_id: f"Unable to check collection '{collection_id}': TIMED OUT"
+        }
+
+        response = self.api_client.post(bulk_endpoint, json=items)
+
+        assert response.status_code == 200
+        results = response.json()["items"]
+        assert [result["status"] for result in results] == ["failed", "failed"]
+        assert results[0]["errors"][0]["loc"] == ["collection"]
+        assert "TIMED OUT" in results[0]["errors"][0]["msg"]
+        check_collections.assert_called_once()
+        assert len(self.db.fetch_many(status="queued")["items"]) == 0
+
+    def test_bulk_create_too_many_items(
+        self, client_authenticated, collection_exists, asset_exists, monkeypatch
+    ):
+        from src.config import settings
+
+        monkeypatch.setattr(settings, "bulk_ingestion_max_items", 2)
+        response = self.api_client.post(bulk_endpoint, json=self.example_items())
+
+        assert response.status_code == 413
+        assert len(self.db.fetch_many(status="queued")["items"]) == 0
+
+
+class TestNdjsonCreate:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        api_client: "TestClient",
+        mock_table: "services.Table",
+        example_ingestion: "schemas.Ingestion",
+    ):
+        from src import services
+
+        self.api_client = api_client
+        self.db = services.Database(mock_table)
+        self.example_ingestion = example_ingestion
+
+    @pytest.fixture(autouse=True)
+    def check_collections(self):
+        with patch("src.validators.check_collections", return_value={}) as m:
+            yield m
+
+    def post_ndjson(self, lines: List[str]):
+        return self.api_client.post(
+            ingestion_endpoint,
+            content="\n".join(lines).encode(),
+            headers={"Content-Type": "application/x-ndjson"},
+        )
+
+    def test_ndjson_create(self, client_authenticated, collection_exists, asset_exists):
+        lines = []
+        for i in range(30):
+            item = jsonable_encoder(self.example_ingestion.item)
+            item["id"] = str(i)
+            lines.append(json.dumps(item))
+        invalid = jsonable_encoder(self.example_ingestion.item)
+        del invalid["geometry"]
+        lines.extend(["", "{not json", json.dumps(invalid)])
+
+        response = self.post_ndjson(lines)
+
+        assert response.status_code == 200
+        assert response.headers["content-type"] == "application/x-ndjson"
+        results = [json.loads(line) for line in response.text.splitlines()]
+        assert [r["line"] for r in results] == [*range(1, 31), 32, 33]
+        assert [r["status"] for r in results] == ["queued"] * 30 + ["failed"] * 2
+        assert "errors" in results[-1]
+        assert len(self.db.fetch_many(status="queued")["items"]) == 30
+
+
+class TestManifestCreate:
+    @pytest.fixture(autouse=True)
+    def setup(self, api_client: "TestClient", mock_table: "services.Table"):
+        from src import services
+
+        self.api_client = api_client
+        self.db = services.Database(mock_table)
+
+    def test_manifest_create(self, client_authenticated):
+        url = "s3://bucket/items.ndjson.gz"
+        with patch(
+            "src.validators.s3_object_is_accessible", return_value={"ContentLength": 100}
+        ) as m:
+            response = self.api_client.post(manifest_endpoint, json={"url": url})
+
+        m.assert_called_once_with(bucket="bucket", key="items.ndjson.gz")
+        assert response.status_code == 201
+        assert response.json()["manifest"] == {
+            "url": url,
+            "offset": 0,
+            "items_loaded": 0,
+        }
+        stored_data = self.db.fetch_many(status="queued")["items"]
+        assert [ingestion.manifest.url for ingestion in stored_data] == [url]
+
+    def test_manifest_rejects_large_gzip(self, client_authenticated):
+        from src.config import settings
+
+        head = {"ContentLength": settings.manifest_max_compressed_size + 1}
+        with patch("src.validators.s3_object_is_accessible", return_value=head):
+            response = self.api_client.post(
+                manifest_endpoint, json={"url": "s3://bucket/items.ndjson.gz"}
+            )
+
+        assert response.status_code == 422
+        assert len(self.db.fetch_many(status="queued")["items"]) == 0
+
+    def test_manifest_requires_s3_url(self, client_authenticated):
+        response = self.api_client.post(
+            manifest_endpoint, json={"url": "https://example.com/items.ndjson"}
+        )
+
+        assert response.status_code == 422
+        assert len(self.db.fetch_many(status="queued")["items"]) == 0
+
+
 class TestList:
     @pytest.fixture(autouse=True)
     def setup(
@@ -172,6 +424,61 @@ class TestList:
         assert json.loads(base64.b64decode(response.json()["next"])) == expected_next
         assert response.json()["items"] == jsonable_encoder(example_ingestions[:limit])
 
+    def test_summary_view(self):
+        self.mock_table.put_item(Item=self.example_ingestion.dynamodb_dict())
+        response = self.api_client.get(ingestion_endpoint, params={"view": "summary"})
+        assert response.status_code == 200
+        assert response.json() == {
+            "items": [
+                jsonable_encoder(
+                    self.example_ingestion,
+                    include={
+                        "id",
+                        "status",
+                        "message",
+                        "created_by",
+                        "created_at",
+                        "updated_at",
+                    },
+                )
+            ],
+            "next": None,
+        }
+
+    def test_count_view(self):
+        self.populate_table(30)
+        response = self.api_client.get(ingestion_endpoint, params={"view": "count"})
+        assert response.status_code == 200
+        assert response.json() == {"count": 30, "next": None}
+
+        response = self.api_client.get(
+            ingestion_endpoint, params={"view": "count", "limit": 10}
+        )
+        assert response.status_code == 200
+        assert response.json()["count"] == 10
+        assert response.json()["next"] is not None
+
+    def test_time_range(self):
+        example_ingestions = self.populate_table(10)
+
+        response = self.api_client.get(
+            ingestion_endpoint,
+            params={
+                "since": example_ingestions[2].created_at.isoformat(),
+                "until": example_ingestions[5].created_at.isoformat(),
+                "order": "desc",
+            },
+        )
+        assert response.status_code == 200
+        assert [i["id"] for i in response.json()["items"]] == ["5", "4", "3", "2"]
+
+    def test_invalid_time_range(self):
+        response = self.api_client.get(
+            ingestion_endpoint,
+            params={"since": "2023-01-02T00:00:00", "until": "2023-01-01T00:00:00"},
+        )
+        assert response.status_code == 422
+
     @pytest.mark.skip(reason="Test is currently broken")
     def test_get_next_page(self):
         example_ingestions = self.populate_table(100)
@@ -191,3 +498,147 @@ class TestList:
             json.loads(ingestion.json(by_alias=True))
             for ingestion in example_ingestions[limit : limit * 2]
         ]
+
+
+class TestUserList:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        client_authenticated: "TestClient",
+        mock_table: "services.Table",
+        example_ingestion: "schemas.Ingestion",
+    ):
+        self.api_client = client_authenticated
+        self.mock_table = mock_table
+        for i, status in enumerate(["queued", "failed", "failed"]):
+            self.mock_table.put_item(
+                Item=example_ingestion.copy(
+                    update={
+                        "id": str(i),
+                        "status": status,
+                        "created_by": "test_user",
+                        "created_at": example_ingestion.created_at + timedelta(hours=i),
+                    }
+                ).dynamodb_dict()
+            )
+        # another user's ingestion
+        self.mock_table.put_item(
+            Item=example_ingestion.copy(update={"status": "failed"}).dynamodb_dict()
+        )
+
+    def test_list_own_ingestions(self):
+        response = self.api_client.get(user_ingestion_endpoint, params={"order": "desc"})
+        assert response.status_code == 200
+        assert [i["id"] for i in response.json()["items"]] == ["2", "1", "0"]
+        assert {i["created_by"] for i in response.json()["items"]} == {"test_user"}
+
+    def test_filters(self):
+        response = self.api_client.get(
+            user_ingestion_endpoint, params={"status": "failed", "view": "summary"}
+        )
+        assert response.status_code == 200
+        assert [i["id"] for i in response.json()["items"]] == ["1", "2"]
+
+        response = self.api_client.get(
+            user_ingestion_endpoint, params={"status": "failed", "view": "count"}
+        )
+        assert response.json() == {"count": 2, "next": None}
+
+
+class TestExport:
+    @pytest.fixture(autouse=True)
+    def setup(
+        self,
+        monkeypatch,
+        client_authenticated: "TestClient",
+        mock_table: "services.Table",
+        example_ingestion: "schemas.Ingestion",
+    ):
+        from src.config import settings
+
+        monkeypatch.setattr(settings, "admin_usernames", ["test_user"])
+        self.api_client = client_authenticated
+        self.ids = {str(i) for i in range(10)}
+        for id in self.ids:
+            mock_table.put_item(
+                Item=example_ingestion.copy(update={"id": id}).dynamodb_dict()
+            )
+
+    def export(self, **params):
+        response = self.api_client.post(export_endpoint, json=params)
+        assert response.status_code == 200
+        *records, progress = [json.loads(line) for line in response.iter_lines()]
+        return records, progress
+
+    def test_requires_admin(self, monkeypatch):
+        from src.config import settings
+
+        monkeypatch.setattr(settings, "admin_usernames", [])
+        response = self.api_client.post(export_endpoint, json={})
+        assert response.status_code == 403
+
+    # moto doesn't support segmented scans, so these export a single segment
+    def test_export_to_response(self):
+        records, progress = self.export(total_segments=1)
+        assert {r["id"] for r in records} == self.ids
+        assert progress["complete"]
+        assert sum(s["exported"] for s in progress["segments"]) == len(self.ids)
+
+    def test_resume_export(self, monkeypatch):
+        from src.config import settings
+
+        # stop each segment after its first page
+        monkeypatch.setattr(settings, "export_time_limit", 0)
+        exported = []
+        progress = {"segments": None}
+        for _ in range(len(self.ids)):
+            records, progress = self.export(
+                total_segments=1, page_size=2, segments=progress["segments"]
+            )
+            exported.extend(r["id"] for r in records)
+            if progress["complete"]:
+                break
+
+        assert progress["complete"]
+        assert sorted(exported) == sorted(self.ids)
+
+    def test_export_stops_when_response_full(self, monkeypatch):
+        from src.config import settings
+
+        # leave room for only the first page of each response
+        monkeypatch.setattr(settings, "export_response_max_bytes", 1)
+        exported = []
+        progress = {"segments": None}
+        for _ in range(len(self.ids)):
+            records, progress = self.export(
+                total_segments=1, page_size=2, segments=progress["segments"]
+            )
+            assert len(records) == 2
+            exported.extend(r["id"] for r in records)
+            if progress["complete"]:
+                break
+
+        assert progress["complete"]
+        assert sorted(exported) == sorted(self.ids)
+
+    def test_export_to_s3(self):
+        import boto3
+        from moto import mock_s3
+
+        with mock_s3():
+            client = boto3.client("s3", region_name="us-east-1")
+            client.create_bucket(Bucket="exports")
+            with patch("src.dependencies.get_staging_client", return_value=client):
+                response = self.api_client.post(
+                    export_endpoint,
+                    json={"url": "s3://exports/audit", "total_segments": 1},
+                )
+            assert response.status_code == 200
+            assert response.json()["complete"]
+
+            exported = set()
+            for obj in client.list_objects_v2(Bucket="exports")["Contents"]:
+                assert obj["Key"].startswith("audit/segment-")
+                body = client.get_object(Bucket="exports", Key=obj["Key"])["Body"]
+                exported.update(json.loads(line)["id"] for line in body.iter_lines())
+        assert exported == self.ids
@@ -0,0 +1,191 @@
+import pytest
+
+
+@pytest.fixture()
+def db(mock_table):
+    from src import services
+
+    return services.Database(mock_table)
+
+
+def test_transition(db, mock_table, example_ingestion):
+    from src import schemas
+
+    mock_table.put_item(Item=example_ingestion.dynamodb_dict())
+
+    assert db.transition(example_ingestion, schemas.Status.failed, message="oops")
+
+    stored = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )["Item"]
+    assert stored["status"] == "failed"
+    assert stored["message"] == "oops"
+    assert stored["item"] == example_ingestion.dynamodb_dict()["item"]
+
+
+def test_transition_many_messages(db, mock_table, example_ingestion):
+    from src import schemas
+
+    other = example_ingestion.copy(update={"id": "other"})
+    for ingestion in [example_ingestion, other]:
+        mock_table.put_item(Item=ingestion.dynamodb_dict())
+
+    skipped = db.transition_many(
+        [example_ingestion, other],
+        schemas.Status.failed,
+        messages=["first error", "second error"],
+    )
+
+    assert skipped == []
+    assert db.fetch_one("test-user", example_ingestion.id).message == "first error"
+    assert db.fetch_one("test-user", "other").message == "second error"
+
+
+def test_transition_unexpected_status(db, mock_table, example_ingestion):
+    from src import schemas
+
+    cancelled = example_ingestion.copy(update={"status": schemas.Status.cancelled})
+    mock_table.put_item(Item=cancelled.dynamodb_dict())
+    missing = example_ingestion.copy(update={"id": "missing"})
+
+    skipped = db.transition_many(
+        [example_ingestion, missing], schemas.Status.succeeded, max_workers=2
+    )
+
+    assert skipped == [example_ingestion, missing]
+    assert db.fetch_one("test-user", example_ingestion.id).status == "cancelled"
+
+
+def test_fetch_many_uses_summary_index(mock_table):
+    from unittest.mock import Mock
+
+    from src import schemas, services
+
+    table = Mock()
+    table.query.return_value = {"Items": [], "Count": 3}
+    db = services.Database(table, summary_index="status-summary")
+
+    assert db.fetch_many("queued", view=schemas.IngestionView.count) == {
+        "count": 3,
+        "next": None,
+    }
+    assert table.query.call_args.kwargs["IndexName"] == "status-summary"
+    assert table.query.call_args.kwargs["Select"] == "COUNT"
+
+    db.fetch_many("queued")
+    assert table.query.call_args.kwargs["IndexName"] == "status"
+
+
+def test_export_scans_segments_in_parallel(example_ingestion):
+    from unittest.mock import Mock
+
+    from src import schemas, services
+
+    pages = {
+        (0, None): ({"id": "a"}, {"created_by": "u", "id": "a"}),
+        (0, "a"): ({"id": "b"}, None),
+        (1, None): ({"id": "c"}, None),
+    }
+
+    def scan(Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        assert TotalSegments == 2
+        record, next = pages[Segment, ExclusiveStartKey and ExclusiveStartKey["id"]]
+        record = {**example_ingestion.dynamodb_dict(), **record}
+        return {"Items": [record], **({"LastEvaluatedKey": next} if next else {})}
+
+    table = Mock()
+    table.meta.client.scan.side_effect = scan
+    written = []
+    segments = [schemas.ExportSegment(segment=n) for n in range(2)]
+
+    services.Database(table).export(
+        segments, 2, write=lambda s, records: written.extend(records)
+    )
+
+    assert sorted(r["id"] for r in written) == ["a", "b", "c"]
+    assert [(s.exported, s.complete, s.next) for s in segments] == [
+        (2, True, None),
+        (1, True, None),
+    ]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_write_compressed_items(mock_table, example_ingestion, compression):
+    from boto3.dynamodb.types import Binary
+    from src import services
+
+    db = services.Database(mock_table, item_compression=compression)
+    db.write_many([example_ingestion])
+
+    stored = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )["Item"]
+    assert isinstance(stored["item"], Binary)
+    assert len(stored["item"].value) < len(example_ingestion.item_json())
+
+    fetched = db.fetch_one("test-user", example_ingestion.id)
+    assert fetched.item_dict() == example_ingestion.item_dict()
+    (listed,) = db.fetch_many(status="queued")["items"]
+    assert listed.item_dict() == example_ingestion.item_dict()
+
+
+@pytest.fixture()
+def item_store(test_environ):
+    import boto3
+    from moto import mock_s3
+    from src import services
+
+    with mock_s3():
+        client = boto3.client("s3", region_name="us-east-1")
+        client.create_bucket(Bucket="staging-bucket")
+        yield services.ItemStore(client, bucket="staging-bucket", threshold=100 * 1024)
+
+
+def test_write_stages_large_items(mock_table, item_store, example_ingestion):
+    from src import services
+
+    db = services.Database(mock_table, item_store=item_store)
+    item_store.threshold = 0
+    db.write(example_ingestion)
+
+    stored = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )["Item"]
+    assert "item" not in stored
+    assert stored["item_url"].startswith("s3://staging-bucket/items/test-user/")
+    assert item_store.get(stored["item_url"]) == example_ingestion.item_json()
+
+    fetched = db.fetch_one("test-user", example_ingestion.id)
+    assert fetched.item_url is None
+    assert fetched.item_dict() == example_ingestion.item_dict()
+
+    listed = db.fetch_many(status="queued")["items"]
+    assert [i.item_url for i in listed] == [stored["item_url"]]
+
+
+def test_write_many_keeps_small_items_inline(mock_table, item_store, example_ingestion):
+    from src import services
+
+    db = services.Database(mock_table, item_store=item_store)
+    db.write_many([example_ingestion])
+
+    stored = mock_table.get_item(
+        Key={"created_by": example_ingestion.created_by, "id": example_ingestion.id}
+    )["Item"]
+    assert stored["item"] == example_ingestion.item_json()
+    assert stored.get("item_url") is None
+
+
+def test_collection_refreshes(mock_refresh_table):
+    from src import services
+
+    refreshes = services.CollectionRefreshes(mock_refresh_table)
+    refreshes.touch(["a", "b"])
+    pending = dict(refreshes.pending())
+    assert sorted(pending) == ["a", "b"]
+
+    refreshes.mark_refreshed("a", pending["a"])
+    assert [c for c, _ in refreshes.pending()] == ["b"]
+
+    refreshes.touch(["a"])
+    assert sorted(c for c, _ in refreshes.pending()) == ["a", "b"]
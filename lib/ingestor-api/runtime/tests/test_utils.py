@@ -1,22 +1,32 @@
-from unittest.mock import Mock, patch
+import gzip
+import io
+import json
+from unittest.mock import MagicMock, Mock, patch
 
 import pytest
 from fastapi.encoders import jsonable_encoder
 from pypgstac.load import Methods
+from src.loader import LoadStrategy
 from src.utils import DbCreds
 
 
 @pytest.fixture()
 def loader():
     with patch("src.utils.Loader", autospec=True) as m:
+        # base item, partition key and partition truncation of every collection
+        m.return_value.collection_json.return_value = ({}, 1, None)
         yield m
 
 
 @pytest.fixture()
 def pgstacdb():
+    from src.utils import pgstac_connections
+
     with patch("src.utils.PgstacDB", autospec=True) as m:
         m.return_value.__enter__.return_value = Mock()
         yield m
+    for connection in pgstac_connections:
+        connection.db = None
 
 
 @pytest.fixture()
@@ -32,4 +42,408 @@ def test_load_items(loader, pgstacdb, example_ingestion, dbcreds):
     loader.return_value.load_items.assert_called_once_with(
         file=jsonable_encoder([example_ingestion.item]),
         insert_mode=Methods.upsert,
+        strategy=LoadStrategy.partitions,
+    )
+
+
+def test_load_items_staged_above_threshold(loader, pgstacdb, example_ingestion, dbcreds):
+    import src.utils as utils
+
+    others = [example_ingestion.copy(update={"id": str(i)}) for i in range(2)]
+    utils.load_items(dbcreds, [example_ingestion, *others], staging_threshold=2)
+    loader.return_value.load_items.assert_called_once_with(
+        file=jsonable_encoder([example_ingestion.item] * 3),
+        insert_mode=Methods.upsert,
+        strategy=LoadStrategy.staging,
+    )
+
+
+@pytest.fixture()
+def manifest_lines():
+    return [json.dumps({"id": str(i)}).encode() for i in range(5)]
+
+
+def mock_s3_client(body: bytes):
+    client = Mock()
+    client.head_object.return_value = {"ContentLength": len(body)}
+
+    def get_object(Bucket, Key, Range):
+        start, end = (int(i) for i in Range.split("=")[1].split("-"))
+        return {"Body": io.BytesIO(body[start : end + 1])}
+
+    client.get_object.side_effect = get_object
+    return client
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_iter_manifest_lines(manifest_lines, compressed):
+    import src.utils as utils
+    from src.schemas import Manifest
+
+    body = b"\n".join(manifest_lines) + b"\n\n"
+    if compressed:
+        # concatenated gzip members should be read as a single stream
+        body = gzip.compress(body[:10]) + gzip.compress(body[10:])
+    manifest = Manifest(url=f"s3://bucket/items.ndjson{'.gz' if compressed else ''}")
+
+    lines = list(utils.iter_manifest_lines(mock_s3_client(body), manifest, 7))
+    assert [line for _, line in lines] == manifest_lines
+
+    manifest.offset = lines[1][0]
+    resumed = list(utils.iter_manifest_lines(mock_s3_client(body), manifest, 7))
+    assert resumed == lines[2:]
+
+
+@pytest.mark.parametrize("compressed", [False, True])
+def test_iter_manifest_lines_deadline(manifest_lines, compressed):
+    import src.utils as utils
+    from src.schemas import Manifest
+
+    body = b"\n".join(manifest_lines) + b"\n"
+    if compressed:
+        body = gzip.compress(body)
+    manifest = Manifest(
+        url=f"s3://bucket/items.ndjson{'.gz' if compressed else ''}", offset=24
     )
+
+    lines = utils.iter_manifest_lines(mock_s3_client(body), manifest, 7, deadline=0)
+    if compressed:
+        with pytest.raises(utils.ManifestTimeout):
+            list(lines)
+    else:
+        # uncompressed manifests are read from their offset, skipping nothing
+        assert len(list(lines)) == 3
+
+
+def test_load_manifest(loader, pgstacdb, dbcreds, manifest_lines):
+    import src.utils as utils
+    from src.schemas import Manifest
+
+    manifest = Manifest(url="s3://bucket/items.ndjson")
+    lines = iter([(i * 10, line) for i, line in enumerate(manifest_lines, 1)])
+    checkpoints = []
+
+    def checkpoint(manifest):
+        checkpoints.append(manifest.copy())
+        return len(checkpoints) < 2
+
+    completed = utils.load_manifest(dbcreds, manifest, lines, 2, checkpoint)
+
+    assert not completed
+    assert [(m.offset, m.items_loaded) for m in checkpoints] == [(20, 2), (40, 4)]
+    assert loader.return_value.load_items.call_count == 2
+    loader.return_value.load_items.assert_called_with(
+        file=[{"id": "2"}, {"id": "3"}], insert_mode=Methods.upsert
+    )
+    assert loader.return_value.transaction.call_count == 2
+
+
+def test_load_manifest_timeout(loader, pgstacdb, dbcreds):
+    import src.utils as utils
+    from src.schemas import Manifest
+
+    def lines():
+        raise utils.ManifestTimeout("Timed out skipping to offset 20")
+        yield
+
+    checkpoint = Mock()
+    manifest = Manifest(url="s3://bucket/items.ndjson.gz", offset=20)
+
+    assert not utils.load_manifest(dbcreds, manifest, lines(), 2, checkpoint)
+    checkpoint.assert_not_called()
+    assert manifest.offset == 20
+
+
+def test_load_items_bisects_failures(loader, pgstacdb, example_ingestion, dbcreds):
+    import src.utils as utils
+
+    ingestions = [
+        example_ingestion.copy(
+            update={
+                "id": str(i),
+                "item": example_ingestion.item.copy(update={"id": str(i)}),
+            }
+        )
+        for i in range(5)
+    ]
+
+    def load_items(file, insert_mode, strategy):
+        if any(item["id"] == "3" for item in file):
+            raise Exception("MOCKED LOAD ERROR")
+
+    loader.return_value.load_items.side_effect = load_items
+
+    failures = utils.load_items(dbcreds, ingestions)
+
+    assert [(i.id, str(e)) for i, e in failures] == [("3", "MOCKED LOAD ERROR")]
+
+
+def test_pgstac_connection_reused(pgstacdb, dbcreds):
+    from src.utils import PgstacConnection
+
+    pgstacdb.return_value = Mock(dsn=dbcreds.dsn_string, connection=Mock(closed=False))
+    connection = PgstacConnection()
+
+    db = connection.get(dbcreds)
+    assert connection.get(dbcreds) is db
+    pgstacdb.assert_called_once_with(dsn=dbcreds.dsn_string)
+    db.connection.execute.assert_called_once_with("SELECT 1;")
+
+
+def test_pgstac_connection_reconnects(pgstacdb, dbcreds):
+    import psycopg
+    from src.utils import PgstacConnection
+
+    pgstacdb.return_value = Mock(dsn=dbcreds.dsn_string, connection=Mock(closed=False))
+    connection = PgstacConnection()
+
+    db = connection.get(dbcreds)
+    db.connection.execute.side_effect = psycopg.OperationalError
+    connection.get(dbcreds)
+
+    assert pgstacdb.call_count == 2
+    db.disconnect.assert_called_once()
+    db.pool.close.assert_called_once()
+
+
+def test_pgstac_connection_closes_pool(dbcreds):
+    from pypgstac.db import PgstacDB
+    from src.utils import PgstacConnection
+
+    pool = Mock()
+    connection = PgstacConnection()
+    connection.db = PgstacDB(
+        dsn=dbcreds.dsn_string, pool=pool, connection=pool.getconn.return_value
+    )
+
+    connection.close()
+
+    pool.putconn.assert_called_once_with(pool.getconn.return_value)
+    pool.close.assert_called_once()
+    assert connection.db is None
+
+
+def test_loader_checks_version_once():
+    from src.loader import Loader
+
+    with patch("pypgstac.load.Loader.check_version") as check_version, patch.object(
+        Loader, "version_checked", False
+    ):
+        Loader(db=Mock())
+        Loader(db=Mock())
+
+    check_version.assert_called_once()
+
+
+def test_loader_records_touched_collections():
+    from pypgstac.load import Partition
+    from src.loader import Loader
+
+    with patch("pypgstac.load.Loader.check_version"), patch(
+        "pypgstac.load.Loader.load_partition"
+    ) as load_partition, patch.object(Loader, "touched_collections", set()):
+        loader = Loader(db=Mock())
+        partition = Partition(
+            name="_items_1",
+            collection="simple-collection",
+            datetime_range_min="2020-12-11",
+            datetime_range_max="2020-12-11",
+            end_datetime_range_min="2020-12-11",
+            end_datetime_range_max="2020-12-11",
+            requires_update=True,
+        )
+        loader.load_partition(partition, [])
+
+        load_partition.assert_called_once()
+        assert Loader.take_touched_collections() == {"simple-collection"}
+        assert Loader.take_touched_collections() == set()
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_load_items_groups_by_partition(
+    loader, pgstacdb, example_ingestion, dbcreds, max_workers
+):
+    import src.utils as utils
+
+    collections = {"monthly": (None, 1, "month"), "unpartitioned": (None, 2, None)}
+
+    def collection_json(id):
+        if id not in collections:
+            raise Exception("MOCKED MISSING COLLECTION")
+        return collections[id]
+
+    loader.return_value.collection_json.side_effect = collection_json
+    ingestions = [
+        example_ingestion.copy(
+            update={
+                "id": id,
+                "item": example_ingestion.item.copy(
+                    update={
+                        "id": id,
+                        "collection": collection,
+                        "properties": example_ingestion.item.properties.copy(
+                            update={"datetime": dt}
+                        ),
+                    }
+                ),
+            }
+        )
+        for id, collection, dt in [
+            ("a", "monthly", "2020-01-01T00:00:00Z"),
+            ("b", "monthly", "2020-02-01T00:00:00Z"),
+            ("c", "monthly", "2020-01-02T00:00:00Z"),
+            ("d", "unpartitioned", "2020-01-01T00:00:00Z"),
+            ("e", "missing", "2020-01-01T00:00:00Z"),
+            ("f", "missing", "2020-01-02T00:00:00Z"),
+        ]
+    ]
+
+    failures = utils.load_items(dbcreds, ingestions, max_workers=max_workers)
+
+    # items of a missing collection fail without being loaded, looking it up once
+    assert [(i.id, str(e)) for i, e in failures] == [
+        ("e", "MOCKED MISSING COLLECTION"),
+        ("f", "MOCKED MISSING COLLECTION"),
+    ]
+    assert [c.args for c in loader.return_value.collection_json.call_args_list].count(
+        ("missing",)
+    ) == 1
+    loaded = sorted(
+        sorted(item["id"] for item in call.kwargs["file"])
+        for call in loader.return_value.load_items.call_args_list
+    )
+    assert loaded == [["a", "c"], ["b"], ["d"]]
+    assert loader.call_count == max_workers
+
+
+def test_load_items_groups_by_method(loader, pgstacdb, example_ingestion, dbcreds):
+    import src.utils as utils
+
+    ingestions = [
+        example_ingestion.copy(
+            update={
+                "id": id,
+                "item": example_ingestion.item.copy(update={"id": id}),
+                "method": method,
+            }
+        )
+        for id, method in [("a", "insert"), ("b", "upsert"), ("c", "insert")]
+    ]
+
+    utils.load_items(dbcreds, ingestions)
+
+    loaded = sorted(
+        (call.kwargs["insert_mode"], [item["id"] for item in call.kwargs["file"]])
+        for call in loader.return_value.load_items.call_args_list
+    )
+    assert loaded == [(Methods.insert, ["a", "c"]), (Methods.upsert, ["b"])]
+
+
+def test_load_items_defers_locked_partitions(
+    loader, pgstacdb, example_ingestion, dbcreds
+):
+    import src.utils as utils
+    from src.loader import PartitionLocked
+
+    loader.return_value.partition_lock.return_value.__enter__.return_value = False
+    failures = utils.load_items(
+        creds=dbcreds, ingestions=[example_ingestion], lock_timeout=1
+    )
+
+    loader.return_value.partition_lock.assert_called_once()
+    loader.return_value.load_items.assert_not_called()
+    assert [i for i, _ in failures] == [example_ingestion]
+    assert isinstance(failures[0][1], PartitionLocked)
+
+
+@pytest.mark.parametrize("acquired", [True, False])
+def test_partition_lock(acquired):
+    from src.loader import Loader
+
+    db = MagicMock()
+    cursor = db.connect.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (acquired,)
+    db.connect.return_value.closed = False
+    with patch("pypgstac.load.Loader.check_version"), patch("src.loader.time.sleep"):
+        loader = Loader(db=db)
+        with loader.partition_lock("collection", "_items_1", timeout=0.2) as locked:
+            assert locked is acquired
+
+    statements = [c.args[0] for c in cursor.execute.call_args_list]
+    assert "pg_try_advisory_lock" in statements[0]
+    assert ("pg_advisory_unlock" in statements[-1]) is acquired
+
+
+@pytest.mark.parametrize(
+    "method,table",
+    [(Methods.upsert, "items_staging_upsert"), (Methods.ignore, "items_staging_ignore")],
+)
+def test_loader_loads_items_staged(method, table):
+    from src.loader import Loader
+
+    db = MagicMock()
+    cursor = db.connect.return_value.cursor.return_value.__enter__.return_value
+    copy = cursor.copy.return_value.__enter__.return_value
+    items = [{"id": "a", "collection": "simple-collection"}]
+    with patch("pypgstac.load.Loader.check_version"), patch.object(
+        Loader, "touched_collections", set()
+    ):
+        Loader(db=db).load_items(
+            file=items, insert_mode=method, strategy=LoadStrategy.staging
+        )
+        assert Loader.take_touched_collections() == {"simple-collection"}
+
+    assert table in cursor.copy.call_args.args[0]
+    copy.write_row.assert_called_once_with((json.dumps(items[0], separators=(",", ":")),))
+    statement, params = cursor.execute.call_args.args
+    assert "update_partition_stats_q" in statement
+    assert params == ["simple-collection", ["a"]]
+
+
+def test_loader_delsert_ignores_staging():
+    from src.loader import Loader
+
+    with patch("pypgstac.load.Loader.check_version"), patch(
+        "pypgstac.load.Loader.load_items"
+    ) as load_items:
+        loader = Loader(db=MagicMock())
+        loader.load_items(
+            file=[], insert_mode=Methods.delsert, strategy=LoadStrategy.staging
+        )
+
+    load_items.assert_called_once_with([], Methods.delsert, False, 10000)
+
+
+def test_load_items_bounds_lock_waits_by_deadline(
+    loader, pgstacdb, example_ingestion, dbcreds
+):
+    import time
+
+    import src.utils as utils
+
+    utils.load_items(
+        creds=dbcreds,
+        ingestions=[example_ingestion],
+        lock_timeout=10,
+        deadline=time.monotonic() - 1,
+    )
+
+    loader.return_value.partition_lock.assert_called_once()
+    assert loader.return_value.partition_lock.call_args.args[-1] == 0
+
+
+def test_partition_lock_without_waiting():
+    from src.loader import Loader
+
+    db = MagicMock()
+    cursor = db.connect.return_value.cursor.return_value.__enter__.return_value
+    cursor.fetchone.return_value = (False,)
+    with patch("pypgstac.load.Loader.check_version"), patch(
+        "src.loader.time.sleep"
+    ) as sleep:
+        loader = Loader(db=db)
+        with loader.partition_lock("collection", "_items_1", timeout=0) as locked:
+            assert not locked
+
+    cursor.execute.assert_called_once()
+    sleep.assert_not_called()
@@ -0,0 +1,225 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import Mock, patch
+
+import pytest
+
+
+@pytest.fixture()
+def validators(test_environ, mock_ssm_parameter_store):
+    from src import validators
+
+    return validators
+
+
+def test_assets_are_accessible(validators):
+    def check(href: str):
+        if "missing" in href:
+            raise ValueError("MOCKED INACCESSIBLE URL ERROR")
+
+    hrefs = {
+        "visual": "https://example.com/visual.tif",
+        "thumbnail": "https://example.com/missing.jpg",
+        "metadata": "https://example.com/missing.xml",
+    }
+    with patch("src.validators.url_is_accessible", side_effect=check) as m:
+        errors = validators.assets_are_accessible(hrefs, max_workers=2)
+
+    assert m.call_count == len(hrefs)
+    assert set(errors) == {"thumbnail", "metadata"}
+    assert all(isinstance(e, ValueError) for e in errors.values())
+
+
+def test_url_is_accessible_times_out(validators):
+    with patch("src.validators.get_http_session") as get_http_session:
+        validators.url_is_accessible("https://example.com/visual.tif")
+
+    get_http_session.return_value.head.assert_called_once_with(
+        "https://example.com/visual.tif", timeout=(5, 10)
+    )
+
+
+def test_url_is_accessible_connection_error(validators):
+    import requests
+
+    with patch("src.validators.get_http_session") as get_http_session:
+        get_http_session.return_value.head.side_effect = (
+            requests.exceptions.ConnectionError("MOCKED DNS FAILURE")
+        )
+        with pytest.raises(ValueError, match="MOCKED DNS FAILURE"):
+            validators.url_is_accessible("https://unreachable.example.com/a.tif")
+
+
+def test_s3_object_is_accessible_connection_error(validators):
+    from botocore.exceptions import ClientError, EndpointConnectionError
+
+    with patch("src.validators.get_s3_client") as get_s3_client:
+        get_s3_client.return_value.exceptions.ClientError = ClientError
+        get_s3_client.return_value.head_object.side_effect = EndpointConnectionError(
+            endpoint_url="https://s3.amazonaws.com"
+        )
+        with pytest.raises(ValueError, match="Could not connect"):
+            validators.s3_object_is_accessible("bucket", "key")
+
+
+def test_asset_is_accessible_unsupported_scheme(validators):
+    with pytest.raises(ValueError, match="Unsupported scheme: ftp"):
+        validators.asset_is_accessible("ftp://example.com/visual.tif")
+
+
+def test_assets_are_accessible_empty(validators):
+    assert validators.assets_are_accessible({}) == {}
+
+
+def test_s3_credentials_refresh(validators):
+    now = datetime.now(timezone.utc)
+    expiring = {
+        "access_key": "a",
+        "secret_key": "b",
+        "token": "expiring",
+        "expiry_time": (now + timedelta(minutes=1)).isoformat(),
+    }
+    fresh = {
+        **expiring,
+        "token": "fresh",
+        "expiry_time": (now + timedelta(hours=1)).isoformat(),
+    }
+    validators.get_s3_credentials.cache_clear()
+    with patch("src.validators.fetch_s3_credentials", side_effect=[expiring, fresh]) as m:
+        credentials = validators.get_s3_credentials()
+        assert credentials.get_frozen_credentials().token == "fresh"
+        assert credentials.get_frozen_credentials().token == "fresh"
+
+    assert m.call_count == 2
+    validators.get_s3_credentials.cache_clear()
+
+
+def test_http_session_reused(validators):
+    assert validators.get_http_session() is validators.get_http_session()
+
+
+@pytest.fixture()
+def collection_cache(validators):
+    validators.get_collection_cache.cache_clear()
+    cache = validators.get_collection_cache()
+    yield cache
+    validators.get_collection_cache.cache_clear()
+
+
+@pytest.fixture()
+def stac_api_lookup(validators, monkeypatch):
+    from src.config import settings
+
+    monkeypatch.setattr(settings, "collection_lookup", "stac_api")
+
+
+@pytest.fixture()
+def pgstac_collection_ids():
+    with patch("src.validators.pgstac_collection_ids", autospec=True) as m:
+        yield m
+
+
+@pytest.fixture()
+def http_session():
+    with patch("src.validators.get_http_session", autospec=True) as m:
+        yield m.return_value
+
+
+def test_collection_exists_prefills_cache(
+    validators, collection_cache, stac_api_lookup, http_session
+):
+    http_session.get.return_value = Mock(
+        ok=True, json=Mock(return_value={"collections": [{"id": "a"}, {"id": "b"}]})
+    )
+
+    assert validators.collection_exists("a")
+    assert validators.collection_exists("b")
+    http_session.get.assert_called_once_with(
+        "https://test-stac.url/collections", timeout=(5, 10)
+    )
+
+
+def test_collection_exists_caches_missing(
+    validators, collection_cache, stac_api_lookup, http_session
+):
+    collection_cache.prefilled = True
+    http_session.get.return_value = Mock(ok=False, status_code=404)
+
+    for _ in range(2):
+        with pytest.raises(ValueError, match="Invalid collection 'missing'"):
+            validators.collection_exists("missing")
+    http_session.get.assert_called_once()
+
+    validators.invalidate_collection("missing")
+    http_session.get.return_value = Mock(ok=True)
+    assert validators.collection_exists("missing")
+    assert http_session.get.call_count == 2
+
+
+def test_collection_exists_skips_caching_errors(
+    validators, collection_cache, stac_api_lookup, http_session
+):
+    collection_cache.prefilled = True
+    http_session.get.return_value = Mock(ok=False, status_code=502)
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            validators.collection_exists("flaky")
+    assert http_session.get.call_count == 2
+
+
+def test_check_collections_stac_api_unreachable(
+    validators, collection_cache, stac_api_lookup, http_session
+):
+    import requests
+
+    http_session.get.side_effect = requests.exceptions.ConnectTimeout("timed out")
+
+    for _ in range(2):
+        errors = validators.check_collections(["a"])
+        assert errors == {"a": "Unable to check collection 'a' in STAC API: timed out"}
+    # prefilling and looking up the collection, neither cached
+    assert http_session.get.call_count == 3
+    http_session.get.assert_called_with(
+        "https://test-stac.url/collections/a", timeout=(5, 10)
+    )
+
+
+def test_check_collections_in_pgstac(
+    validators, collection_cache, pgstac_collection_ids, http_session
+):
+    pgstac_collection_ids.return_value = {"a"}
+
+    errors = validators.check_collections(["a", "b", "a"])
+
+    pgstac_collection_ids.assert_called_once_with(["a", "b"])
+    assert set(errors) == {"b"}
+    assert validators.collection_exists("a")
+    with pytest.raises(ValueError, match="not found in pgSTAC"):
+        validators.collection_exists("b")
+    pgstac_collection_ids.assert_called_once()
+    http_session.get.assert_not_called()
+
+
+def test_check_collections_falls_back_to_stac_api(
+    validators, collection_cache, pgstac_collection_ids, http_session
+):
+    pgstac_collection_ids.side_effect = Exception("MOCKED DB ERROR")
+    http_session.get.return_value = Mock(
+        ok=True, json=Mock(return_value={"collections": [{"id": "a"}]})
+    )
+
+    assert validators.check_collections(["a"]) == {}
+    http_session.get.assert_called_once_with(
+        "https://test-stac.url/collections", timeout=(5, 10)
+    )
+
+
+def test_db_pool_opened(validators):
+    with patch("src.validators.ConnectionPool") as pool, patch(
+        "src.utils.get_db_credentials"
+    ):
+        validators.get_db_pool.cache_clear()
+        validators.get_db_pool()
+        validators.get_db_pool.cache_clear()
+
+    assert pool.call_args.kwargs["open"] is True